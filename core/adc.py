@@ -1,30 +1,41 @@
 # Copyright (C) 2024 Pico Technology Ltd. See LICENSE file for terms.
 from picosdk.psospa import psospa as ps
 from picosdk.constants import PICO_STATUS, PICO_STATUS_LOOKUP
-from picosdk.functions import adc2mVV2, mV2adcV2
+from picosdk.functions import mV2adcV2
 from picosdk.PicoDeviceEnums import picoEnum as enums
-from pycoviewlib.constants import DATA_DIR, chInputRanges, couplings, pCouplings, channelIDs
+from pycoviewlib.constants import PV_DIR, DATA_DIR, chInputRanges, couplings, pCouplings, channelIDs
+from pycoviewlib.acquisition import BlockReady, BufferPool, DeadTime, unit_info
+from pycoviewlib import analysis
+from pycoviewlib.writers import DataWriter, EventWriter, RotatingWriter, RunMetadata, Checkpoint
+from pycoviewlib.archive import WaveformArchive
+from pycoviewlib.ring import WaveformRing
 from pycoviewlib.functions import (
-    detect_gate_open_closed, calculate_charge, log, key_from_value, format_data
+    adc2mV_array, detect_gate_open_closed, calculate_charge, log, close_log, key_from_value
 )
-from ctypes import c_int16, c_int32, c_uint32, c_double, Array, byref
+from ctypes import c_int16, c_int32, c_uint32, c_uint64, c_double, byref
 import numpy as np
-import matplotlib.pyplot as plt
 from datetime import datetime
-from typing import Optional, Union
+from typing import Optional, Union, TYPE_CHECKING
 from itertools import islice
 
+if TYPE_CHECKING:  # Matplotlib is imported when plotting only (see plot_data)
+    import matplotlib.pyplot as plt
+
 
 def plot_data(
-        bufferGate: Array[c_int16],
-        bufferSignal: Array[c_int16],
+        bufferGate: np.ndarray,
+        bufferSignal: np.ndarray,
         gate: dict,
         time: np.ndarray,
         charge: float,
         peakToPeak: float,
         title: str,
-        ) -> plt.Figure:
-    maxSignal = max(bufferSignal[gate['open']['index']:gate['closed']['index']])
+        ) -> 'plt.Figure':
+    import matplotlib.pyplot as plt
+
+    maxIndex = gate['open']['index'] \
+        + int(np.argmax(bufferSignal[gate['open']['index']:gate['closed']['index']]))
+    maxSignal = bufferSignal[maxIndex]
 
     fig, ax = plt.subplots(figsize=(10, 6), layout='tight')
     ax.grid()
@@ -61,16 +72,16 @@ def plot_data(
     """ Peak-To-Peak """
     ax.annotate(
         '',
-        xy=(time[bufferSignal.index(maxSignal)], maxSignal),
+        xy=(time[maxIndex], maxSignal),
         xytext=(
-            time[bufferSignal.index(maxSignal)],
+            time[maxIndex],
             min(bufferSignal[gate['open']['index']:gate['closed']['index']])
         ),
         fontsize=12,
         arrowprops=dict(edgecolor='black', arrowstyle='<->', shrinkA=0, shrinkB=0)
     )
     ax.text(
-        time[bufferSignal.index(maxSignal)] + 0.5,
+        time[maxIndex] + 0.5,
         maxSignal - peakToPeak / 2, f'Peak-to-peak\n{peakToPeak:.2f} mV'
     )
 
@@ -85,9 +96,19 @@ class ADC:
         self.params = params
         self.probe = probe
         self.timestamp: str = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+        # Resuming a run that did not stop cleanly: same dataset, see Checkpoint
+        self.checkpoint = Checkpoint(f'{PV_DIR}/checkpoint_adc.json', params.get('checkpointSeconds', 10))
+        self.resume = False
+        if not self.probe and params.get('resume', 0):
+            state = self.checkpoint.load()
+            if state and not state['finished'] \
+                    and [state['filename'], state['dformat']] == [params['filename'], params['dformat']]:
+                self.timestamp = state['timestamp']
+                self.resume = True
         if not self.probe:
             self.datahandle: str = (f"{DATA_DIR}/Data/{self.params['filename']}"
                                     f"_{self.timestamp}_data.{self.params['dformat']}")
+            self.metahandle: str = f"{DATA_DIR}/Data/{self.params['filename']}_{self.timestamp}_run.json"
             if self.params['log']:  # Creating loghandle if required
                 self.loghandle: str = f"{params['filename']}_{self.timestamp}_adc_log.txt"
 
@@ -104,6 +125,7 @@ class ADC:
             channelIDs.index(id) for id in channelIDs \
             if self.params[f'ch{id}enabled'] and id != channelIDs[self.channelGate]
         ][0]
+        self.channels = [channelIDs[self.channelGate], channelIDs[self.channelSignal]]
 
         self.gateChRangeMax = chInputRanges[params[f'ch{channelIDs[self.channelGate]}range']] * 1000000
         self.sigChRangeMax = chInputRanges[params[f'ch{channelIDs[self.channelSignal]}range']] * 1000000
@@ -113,6 +135,15 @@ class ADC:
         self.preTrigSamples = params['preTrigSamples']
         self.postTrigSamples = params['postTrigSamples']
         self.maxSamples = params['maxSamples']
+        # Rapid-block mode: no. of triggers captured per arm, one memory segment each
+        # (segmented memory is not used while streaming, see core.streaming)
+        self.nCaptures = 1 if self.probe or params.get('streaming', 0) \
+            else max(1, params.get('nCaptures', 1))
+        # Sub-sample threshold crossing times (linear interpolation)
+        self.interpolate = bool(params.get('interpolate', 0))
+        # Charge integration: 'rectangle' or 'trapezoid', optional pre-trigger baseline subtraction
+        self.chargeMethod = params.get('chargeMethod', 'rectangle')
+        self.baselineSamples = self.preTrigSamples if params.get('baselineSubtraction', 0) else 0
         # TODO: is it possible to make this less convoluted?
         # yes probably becaue you can't use 0, 1, or 2 anymore to select coupling in setChannelOn
         self.sigCoupling = couplings[key_from_value(couplings, params[f'ch{channelIDs[self.channelSignal]}coupling'])][1]
@@ -121,10 +152,25 @@ class ADC:
         self.timebase = c_uint32()
         self.timeIntervalns = c_double()
         self.overvoltage = c_int16()  # Overvoltage (channel) flag
-        self.rmaxSamples = c_int32(self.maxSamples)  # Actual number of samples collected
+        self.overvoltageBulk = (c_int16 * self.nCaptures)()  # Overvoltage flags per segment
+        self.rmaxSamples = c_uint64(self.maxSamples)  # Actual number of samples collected
         self.maxADC = c_int16()
 
         self.count = 1  # Capture counter
+        # Capture completion: driver callback, adaptive polling as fallback
+        self.blockReady = BlockReady(
+            timeout=self.nCaptures * self.autoTrigms / 1000 + 1,
+            useCallback=bool(params.get('readyCallback', 1))
+        )
+        self.pool: BufferPool = None  # Capture buffers, created in setup()
+        self.writer: DataWriter | EventWriter | RotatingWriter = None  # Data file writer, created in setup()
+        self.archive: WaveformArchive = None  # Raw waveform archive, if enabled
+        self.ring: WaveformRing = None  # Ring buffer of the latest waveforms, if enabled
+        self.triggerOffsets = np.zeros(self.nCaptures, dtype=np.int64)  # Per segment
+        self.triggerOffsetUnits = (c_int32 * self.nCaptures)()  # Time units, per segment
+        self.armed = False  # Whether a capture is already running into the pool
+        self.metadata: RunMetadata = None  # Run metadata file, created in setup()
+        self.deadTime = DeadTime()
 
     def __check_health(self, status: hex, stop: Optional[bool] = False) -> str | None:
         if status != PICO_STATUS['PICO_OK']:
@@ -143,12 +189,10 @@ class ADC:
     def setup(self) -> list[str] | None:
         err = []
 
-        """ Logging runtime parameters """
+        """ Logging run start, parameters are saved to the run metadata file """
         if self.params['log'] and not self.probe:
-            log(self.loghandle, '==> Running acquisition with parameters:', time=True)
-            col_width = max([len(k) for k in self.params.keys()])
-            for key, value in self.params.items():
-                log(self.loghandle, f'{key: <{col_width}} {value:}')
+            log(self.loghandle, '==> Running acquisition with parameters in:', time=True)
+            log(self.loghandle, f'{self.metahandle}')
 
         if not self.probe:
             header = []
@@ -159,8 +203,34 @@ class ADC:
             if self.params['includePeakToPeak']:
                 header.append('peak2peak (mV)')
             header.append('charge (pC)')
-            with open(self.datahandle, 'a') as out:  # Creating data output file
-                out.write(format_data(header, self.params['dformat']))
+            rotation = {
+                key: self.params.get(key, 0) for key in ['rotateEvents', 'rotateMB', 'rotateMinutes']
+            }
+            if any(rotation.values()):  # Data file split in segments, see RotatingWriter
+                self.writer = RotatingWriter(
+                    self.datahandle, self.params['dformat'], header, **rotation,
+                    flushRows=self.params.get('flushRows', 1000),
+                    flushSeconds=self.params.get('flushSeconds', 1.0),
+                    resume=self.resume
+                )
+            elif self.params['dformat'] == 'npy':  # Binary records, see EventWriter
+                self.writer = EventWriter(
+                    self.datahandle,
+                    flushRows=self.params.get('flushRows', 1000),
+                    flushSeconds=self.params.get('flushSeconds', 1.0),
+                    resume=self.resume
+                )
+            else:  # Creating data output file, open until stop()
+                self.writer = DataWriter(
+                    self.datahandle, self.params['dformat'], header,
+                    flushRows=self.params.get('flushRows', 1000),
+                    flushSeconds=self.params.get('flushSeconds', 1.0),
+                    resume=self.resume
+                )
+            if self.resume:  # Counter carries on from the events already in the data file
+                self.count = self.writer.resumed + 1
+                if self.params['log']:
+                    log(self.loghandle, f'==> Resuming at event no. {self.count}', time=True)
 
         """ Opening PicoScope connection: returns handle for future use in API functions """
         self.status['openUnit'] = ps.psospaOpenUnit(
@@ -219,6 +289,8 @@ class ADC:
             self.gateChRangeMax,
             self.maxADC
         )
+        self.thresholdmV = (self.thresholdADC * (self.gateChRangeMax / 1000000)) \
+            / self.maxADC.value - self.gateAnalogOffset
 
         # Setting up simple trigger on target channel
         self.status['setSimpleTrigger'] = ps.psospaSetSimpleTrigger(
@@ -231,7 +303,31 @@ class ADC:
             self.autoTrigms * 1000                      # wait for (microseconds)
         )
         err.append(self.__check_health(self.status['setSimpleTrigger']))
- 
+
+        """ Capture buffers, allocated and registered with the driver only once.
+        Memory is split in two slots of `nCaptures` segments each, so the scope
+        can capture into one slot while the other is analyzed.
+        (Rapid-block mode: one segment per trigger) """
+        self.pool = BufferPool(self.channels, self.maxSamples, self.nCaptures)
+        maxSegmentSamples = c_uint64()
+        self.status['memorySegments'] = ps.psospaMemorySegments(
+            self.chandle, self.pool.nSegments, byref(maxSegmentSamples)
+        )
+        err.append(self.__check_health(self.status['memorySegments']))
+        if maxSegmentSamples.value < self.maxSamples:
+            err.append(
+                f'{self.pool.nSegments} segments allow at most '
+                f'{maxSegmentSamples.value} samples per capture'
+            )
+        if self.nCaptures > 1:
+            self.status['setNoOfCaptures'] = ps.psospaSetNoOfCaptures(
+                self.chandle, self.nCaptures
+            )
+            err.append(self.__check_health(self.status['setNoOfCaptures']))
+        for key, status in self.pool.register(self.chandle, self.downsampleModeRaw).items():
+            self.status[key] = status
+            err.append(self.__check_health(status))
+
         # Get timebase info & pre/post trigger samples to be collected
         enabledChFlags = sum([       # v~~~ Filtering only A, B, C, D flags
             flag for flag, id in zip(islice(enums.PICO_CHANNEL_FLAGS.values(), 4), channelIDs) \
@@ -248,84 +344,262 @@ class ADC:
 
         self.timeIntervalns = c_double(self.timeIntervalns.value * 1000000000)  # to nanoseconds
 
-        return err
+        """ Raw waveform archive, written next to the data file """
+        if self.params.get('archiveWaveforms', 0) and not self.probe:
+            self.archive = WaveformArchive(
+                f"{DATA_DIR}/Data/{self.params['filename']}_{self.timestamp}_waveforms.pvw",
+                self.calibration() | {'timebase': self.timebase.value, 'timestamp': self.timestamp},
+                self.maxSamples,
+                chunkEvents=self.params.get('archiveChunkEvents', 256),
+                level=self.params.get('archiveCompression', 1),
+                resume=self.resume
+            )
 
-    def run(self) -> tuple[float | None, list[str] | None] | plt.Figure:
-        err = []
+        """ Ring buffer of the latest waveforms, readable while acquiring (see WaveformRing) """
+        if self.params.get('ringEvents', 0) and not self.probe:
+            self.ring = WaveformRing.create(
+                f'{PV_DIR}/ring.buf',
+                self.calibration() | {'timestamp': self.timestamp},
+                self.maxSamples,
+                self.params['ringEvents']
+            )
 
-        # Logging capture
-        if self.params['log'] and not self.probe:
-            to_be_logged = [dict(entry=f'==> Beginning capture no. {self.count}', time=True)]
+        """ Run metadata, next to the data file (totals are added in stop()) """
+        if not self.probe and all([e is None for e in err]):
+            self.metadata = RunMetadata(self.metahandle, {
+                'mode': 'adc',
+                'params': self.params,
+                'timebase': self.timebase.value,
+                'timeIntervalns': self.timeIntervalns.value,
+                'maxADC': self.maxADC.value,
+                'device': unit_info(self.chandle),
+                'files': {
+                    'data': self.writer.path,
+                    'archive': self.archive.path if self.archive is not None else None,
+                    'log': f'{DATA_DIR}/Data/{self.loghandle}' if self.params['log'] else None,
+                },
+            }, resume=self.resume, resumedEvents=self.count - 1)
+            self.checkpoint.start({
+                'mode': 'adc',
+                'filename': self.params['filename'],
+                'dformat': self.params['dformat'],
+                'timestamp': self.timestamp,
+                'data': self.writer.path,
+                'count': self.count,
+            })
+
+        return err
 
-        """ Run block capture """
+    def __arm(self) -> str | None:
+        """ Starts a block capture into the current pool slot """
+        self.blockReady.arm()
         self.status['runBlock'] = ps.psospaRunBlock(
             self.chandle,
             self.preTrigSamples,
             self.postTrigSamples,
             self.timebase,
-            None,                   # returned recovery time (milliseconds or NULL)
-            0,                      # segment index
-            None,                   # lpReady (using psospaIsReady instead)
-            None                    # pParameter
+            None,                      # returned recovery time (milliseconds or NULL)
+            self.pool.segment(self.pool.current),  # segment index (first one in rapid-block mode)
+            self.blockReady.callback,  # lpReady (None to poll psospaIsReady)
+            None                       # pParameter
         )
-        err.append(self.__check_health(self.status['runBlock'], stop=True))
+        return self.__check_health(self.status['runBlock'], stop=True)
+
+    def acquire(self) -> tuple[dict[str, np.ndarray] | None, list[str | None]]:
+        """
+        Waits for the running capture and retrieves it, then re-arms straight
+        away on the other pool slot. Returns views on the retrieved slot:
+        (nCaptures, samples) raw ADC counts per channel, or None if the
+        capture could not be retrieved (the slot still holds an older one)
+        or the wait was cancelled (see BlockReady.cancel()).
+        """
+        err = []
 
-        """ Check for data collection to finish using psospaIsReady """
-        ready = c_int16(0)
-        check = c_int16(0)
-        while ready.value == check.value:
-            ps.psospaIsReady(self.chandle, byref(ready))
+        """ Arm block capture, unless it was re-armed at the end of the previous run """
+        if not self.armed:
+            err.append(self.__arm())
+
+        """ Wait for data collection to finish (driver callback or back-off polling) """
+        self.status['isReady'] = self.blockReady.wait(self.chandle)
+        err.append(self.__check_health(self.status['isReady'], stop=True))
+        if not all([e is None for e in err]) or self.blockReady.cancelled:
+            return None, err
+        self.deadTime.ready()
+
+        """ Retrieve data from scope to the pool buffers registered in setup() """
+        slot = self.pool.current
+        first = self.pool.segment(slot)
+        self.rmaxSamples.value = self.maxSamples
+        if self.nCaptures == 1:
+            self.status['getValues'] = ps.psospaGetValues(
+                self.chandle,
+                0,                        # start index
+                byref(self.rmaxSamples),  # actual no. of samples retrieved (<= maxSamples)
+                1,                        # downsample ratio
+                self.downsampleModeRaw,   # downsample mode
+                first,                    # memory segment index where data is stored
+                byref(self.overvoltage)   # overvoltage (channel) flag
+            )
+            err.append(self.__check_health(self.status['getValues'], stop=True))
+        else:
+            self.status['getValuesBulk'] = ps.psospaGetValuesBulk(
+                self.chandle,
+                0,                          # start index
+                byref(self.rmaxSamples),    # actual no. of samples retrieved (<= maxSamples)
+                first,                      # first segment index
+                first + self.nCaptures - 1, # last segment index
+                1,                          # downsample ratio
+                self.downsampleModeRaw,     # downsample mode
+                byref(self.overvoltageBulk) # overvoltage (channel) flags, one per segment
+            )
+            err.append(self.__check_health(self.status['getValuesBulk'], stop=True))
+        if not all([e is None for e in err]):
+            return None, err
+
+        """ Trigger time offsets of the captured segments, archived with the waveforms
+        (not fatal: the archive stores NaN if they are not available) """
+        triggerOffsetns = None
+        if self.archive is not None:
+            self.status['getTriggerTimeOffsets'] = ps.psospaGetValuesTriggerTimeOffsetBulk(
+                self.chandle,
+                self.triggerOffsets.ctypes.data,  # times, one per segment
+                byref(self.triggerOffsetUnits),   # time units (PICO_FS ... PICO_S), one per segment
+                first,                            # first segment index
+                first + self.nCaptures - 1        # last segment index
+            )
+            if self.status['getTriggerTimeOffsets'] == PICO_STATUS['PICO_OK']:
+                units = np.ctypeslib.as_array(self.triggerOffsetUnits)
+                triggerOffsetns = self.triggerOffsets * 10.0 ** (3 * units - 6)
 
-        """ Set data buffers location for data collection """
-        bufferGateMax = (c_int16 * self.maxSamples)()
-        bufferSigMax = (c_int16 * self.maxSamples)()
+        """ Re-arm straight away: the next capture fills the other slot while
+        this one is being analyzed """
+        self.armed = False
+        if not self.probe:
+            self.pool.swap()
+            err.append(self.__arm())
+            self.armed = err[-1] is None
+            self.deadTime.armed()
+
+        buffers = {id: self.pool.buffers[id][slot, :, :self.rmaxSamples.value] for id in self.channels}
+        if self.archive is not None:
+            overvoltage = np.ctypeslib.as_array(self.overvoltageBulk) if self.nCaptures > 1 \
+                else np.array([self.overvoltage.value])
+            self.archive.append(buffers, overvoltage, triggerOffsetns)
+        if self.ring is not None:
+            self.ring.append(buffers)
+
+        return buffers, err
+
+    def run(self) -> 'tuple[float | list[float] | None, list[str] | None] | plt.Figure':
+        buffers, err = self.acquire()
+        if buffers is None or not all([e is None for e in err]):  # Pool slot not refilled, see acquire()
+            return None, err
+
+        """ Probe: analyze & plot the single captured event """
+        if self.probe:
+            return self.plot({id: buffers[id][0] for id in self.channels}), err
+
+        """ Analyze all captured segments at once, then record them """
+        values = self.save(analysis.analyze(buffers, self.calibration()))
+
+        if not values:
+            return None, err
+        if self.nCaptures == 1:
+            return values[0], err
+
+        return values, err
+
+    def save(self, results: dict[str, np.ndarray]) -> list[float]:
+        """
+        Records the events of a batched analysis (see pycoviewlib.analysis),
+        skipping timed out segments. Returns the recorded values.
+        """
+        values = []
+        nEvents = len(results['timeout'])
+        if self.params['log']:
+            to_be_logged = [dict(entry=f'==> Beginning capture no. {self.count}', time=True)]
 
-        self.status['setDataBufferGate'] = ps.psospaSetDataBuffer(
-            self.chandle,
-            self.channelGate,                      # source
-            byref(bufferGateMax),                  # pointer to gate buffer
-            self.maxSamples,
-            enums.PICO_DATA_TYPE['PICO_INT16_T'],
-            0,                                     # waveform (segment index)
-            self.downsampleModeRaw,                # downsample mode
-            self.actionClearAdd                    # clear busy buffers then add new
-        )
-        err.append(self.__check_health(self.status['setDataBufferGate'], stop=True))
+        for segment in range(nEvents):
+            # Skip current segment if trigger timed out
+            if results['timeout'][segment]:
+                if self.params['log']:
+                    to_be_logged.append(f'Skipping segment {segment} (trigger timeout).')
+                continue
 
-        self.status['setDataBufferSig'] = ps.psospaSetDataBuffer(
-            self.chandle,
-            self.channelSignal,                    # source
-            byref(bufferSigMax),                   # pointer to signal buffer
-            self.maxSamples,
-            enums.PICO_DATA_TYPE['PICO_INT16_T'],
-            0,                                     # waveform (segment index)
-            self.downsampleModeRaw,                # downsample mode
-            self.actionAdd                         # add new buffer
-        )
-        err.append(self.__check_health(self.status['setDataBufferSig'], stop=True))
+            values.append(self.record(analysis.select(results, segment)))
+        self.checkpoint.update(self.count)
 
-        """ Retrieve data from scope to buffers assigned above """
-        self.status['getValues'] = ps.psospaGetValues(
-            self.chandle,
-            0,                        # start index
-            byref(self.rmaxSamples),  # actual no. of samples retrieved (<= maxSamples)
-            1,                        # downsample ratio
-            self.downsampleModeRaw,   # downsample mode
-            0,                        # memory segment index where data is stored
-            byref(self.overvoltage)   # overvoltage (channel) flag
-        )
-        err.append(self.__check_health(self.status['getValues'], stop=True))
+        if self.params['log']:
+            if values:
+                to_be_logged.append(f'Ok! ({len(values)}/{nEvents} events)')
+            for item in to_be_logged:
+                if isinstance(item, dict):
+                    log(self.loghandle, **item)
+                else:
+                    log(self.loghandle, item)
 
-        """ Convert ADC counts data to mV """
-        bufferGatemV = adc2mVV2(bufferGateMax, self.gateChRangeMax, self.maxADC)
-        bufferSignalmV = adc2mVV2(bufferSigMax, self.sigChRangeMax, self.maxADC)
+        return values
 
-        """ Removing the analog offset from data points """
-        thresholdmV = (self.thresholdADC * (self.gateChRangeMax / 1000000)) \
-            / self.maxADC.value - self.gateAnalogOffset
-        for i in range(self.maxSamples):
-            bufferGatemV[i] -= self.gateAnalogOffset
-            bufferSignalmV[i] -= self.sigAnalogOffset
+    def record(self, event: dict[str, Union[float, dict, list, np.ndarray]]) -> float:
+        """ Appends an analyzed event to the data file, returns its charge """
+        if self.params['dformat'] == 'npy':
+            self.writer.write({
+                'counter': self.count,
+                'charge': event['charge'],
+                'amplitude': event['amplitude'],
+                'peakToPeak': event['peakToPeak'],
+            })
+            self.count += 1
+            return event['charge']
+
+        data = []
+        if self.params['includeCounter']:
+            data.append(self.count)
+        if self.params['includeAmplitude']:
+            data.append(event['amplitude'])
+        if self.params['includePeakToPeak']:
+            data.append(event['peakToPeak'])
+        data.append(event['charge'])
+        self.writer.write(data)
+        self.count += 1
+
+        return event['charge']
+
+    def calibration(self) -> dict[str, Union[int, float, str, list, dict]]:
+        """ Acquisition settings needed by pycoviewlib.analysis """
+        gateID, signalID = self.channels
+        return {
+            'mode': 'adc',
+            'channels': self.channels,
+            'rangeMax': {gateID: self.gateChRangeMax, signalID: self.sigChRangeMax},
+            'offset': {gateID: self.gateAnalogOffset, signalID: self.sigAnalogOffset},
+            'thresholdmV': {gateID: float(self.thresholdmV)},
+            'maxADC': self.maxADC.value,
+            'timeIntervalns': self.timeIntervalns.value,
+            'coupling': self.sigCoupling,
+            'chargeMethod': self.chargeMethod,
+            'baselineSamples': self.baselineSamples,
+            'interpolate': self.interpolate,
+        }
+
+    def analyze(
+            self,
+            buffers: dict[str, np.ndarray]
+            ) -> dict[str, Union[float, dict, list, np.ndarray]] | None:
+        """
+        Runs the charge analysis on a single captured event, `buffers` maps
+        the gate and signal channel IDs to their raw ADC counts.
+        Returns None if the trigger timed out.
+        """
+        gateID, signalID = self.channels
+
+        """ Convert ADC counts data to mV, removing the analog offset """
+        bufferGatemV = adc2mV_array(
+            buffers[gateID], self.gateChRangeMax, self.maxADC, self.gateAnalogOffset
+        )
+        bufferSignalmV = adc2mV_array(
+            buffers[signalID], self.sigChRangeMax, self.maxADC, self.sigAnalogOffset
+        )
 
         """ Create time data """
         time = np.linspace(
@@ -336,68 +610,73 @@ class ADC:
 
         """ Detect where the threshold was hit (both falling & rising edge) """
         gate = detect_gate_open_closed(
-            bufferGatemV, time, thresholdmV, self.maxSamples, self.timeIntervalns.value
+            bufferGatemV, time, self.thresholdmV, self.maxSamples, self.timeIntervalns.value,
+            interpolate=self.interpolate
         )
-        # Skip current acquisition if trigger timed out
         if all([gopen['ns'] == 0.0 for gopen in gate.values()]):
-            if self.params['log'] and not self.probe:
-                to_be_logged.append('Skipping (trigger timeout).')
-            return None, [None]
+            return None
 
         """ Calculating relevant data """
-        data = []
-        if self.params['includeCounter']:
-            data.append(self.count)
+        amplitude, peakToPeak = None, None
         if self.params['includeAmplitude'] or self.probe:
-            amplitude = abs(min(bufferSignalmV))
-            data.append(amplitude)
+            amplitude = abs(float(bufferSignalmV.min()))
         if self.params['includePeakToPeak'] or self.probe:
-            peakToPeak = abs(min(bufferSignalmV)) \
-                - abs(max(bufferSignalmV[gate['open']['index']:gate['closed']['index']]))
-            data.append(peakToPeak)
+            peakToPeak = abs(float(bufferSignalmV.min())) \
+                - abs(float(bufferSignalmV[gate['open']['index']:gate['closed']['index']].max()))
         charge = calculate_charge(
             bufferSignalmV, (gate['open']['index'], gate['closed']['index']),
-            self.timeIntervalns.value, self.sigCoupling
+            self.timeIntervalns.value, self.sigCoupling, self.chargeMethod, self.baselineSamples
         )
-        data.append(charge)
-
-        """ Logging capture results """
-        if self.params['log'] and not self.probe:
-            to_be_logged.append('Ok!')
-            for item in to_be_logged:
-                if isinstance(item, dict):
-                    log(self.loghandle, **item)
-                else:
-                    log(self.loghandle, item)
-
-        """ Print data to file """
-        if not self.probe:
-            with open(self.datahandle, 'a') as out:
-                out.write(format_data(data, self.params['dformat']))
-        else:
-            figure = plot_data(
-                bufferGatemV, bufferSignalmV, gate, time,
-                charge, peakToPeak, f'ADC Probe {self.timestamp}'
-            )
-            return figure, err
-
-        self.count += 1
 
-        return charge, err
+        return {
+            'charge': charge,
+            'amplitude': amplitude,
+            'peakToPeak': peakToPeak,
+            'gate': gate,
+            'time': time,
+            'bufferGatemV': bufferGatemV,
+            'bufferSignalmV': bufferSignalmV,
+        }
+
+    def plot(self, buffers: dict[str, np.ndarray]) -> Optional['plt.Figure']:
+        """ Analyzes & plots a single event, None if the trigger timed out """
+        event = self.analyze(buffers)
+        if event is None:
+            return None
+
+        return plot_data(
+            event['bufferGatemV'], event['bufferSignalmV'], event['gate'], event['time'],
+            event['charge'], event['peakToPeak'], f'ADC Probe {self.timestamp}'
+        )
 
     def stop(self) -> str | None:
         """ Stop acquisition & close unit """
+        self.armed = False
+        if self.writer is not None:
+            self.writer.close()
+        if self.archive is not None:
+            self.archive.close()
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
         self.status['stop'] = ps.psospaStop(self.chandle)
+        self.blockReady.cancel()  # A capture being waited for (follower thread) will not come
         err = self.__check_health(self.status['stop'])
         ps.psospaCloseUnit(self.chandle)
+        if self.metadata is not None:
+            self.metadata.finish(self.count - 1, self.deadTime.summary(), err)
+            self.metadata = None
+        self.checkpoint.finish(self.count)
         if err:
             if self.params['log'] and not self.probe:
                 log(self.loghandle, f'==> Job finished with error: {err}', time=True)
+                close_log(self.loghandle)
             return err
 
         """ Logging exit status & data location """
         if self.params['log'] and not self.probe:
             log(self.loghandle, '==> Job finished without errors. Data saved to:', time=True)
-            log(self.loghandle, f'{self.datahandle}')
+            log(self.loghandle, f'{self.writer.path}')
+            close_log(self.loghandle)
 
         return None
@@ -1,26 +1,33 @@
 # Copyright (C) 2024 Pico Technology Ltd. See LICENSE file for terms.
 from picosdk.psospa import psospa as ps
 from picosdk.constants import PICO_STATUS, PICO_STATUS_LOOKUP
-from picosdk.functions import adc2mVV2, mV2adcV2
+from picosdk.functions import mV2adcV2
 from picosdk.PicoDeviceEnums import picoEnum as enums
 from pycoviewlib.constants import (
-    DATA_DIR, chInputRanges, pCouplings, channelIDs, TriggerCondition,
+    PV_DIR, DATA_DIR, chInputRanges, pCouplings, channelIDs, TriggerCondition,
     TriggerDirection, TriggerProperties,
 )
-from pycoviewlib.functions import log, detect_gate_open_closed, format_data
-from ctypes import c_int16, c_int32, c_uint32, c_double, Array, byref
+from pycoviewlib.acquisition import BlockReady, BufferPool, DeadTime, unit_info
+from pycoviewlib import analysis
+from pycoviewlib.writers import DataWriter, EventWriter, RotatingWriter, RunMetadata, Checkpoint
+from pycoviewlib.archive import WaveformArchive
+from pycoviewlib.ring import WaveformRing
+from pycoviewlib.functions import log, close_log, adc2mV_array, detect_gate_open_closed
+from ctypes import c_int16, c_int32, c_uint32, c_uint64, c_double, byref
 import numpy as np
-import matplotlib.pyplot as plt
 from datetime import datetime
-from typing import Optional, Union
+from typing import Optional, Union, TYPE_CHECKING
 from itertools import islice
 
+if TYPE_CHECKING:  # Matplotlib is imported when plotting only (see plot_data)
+    import matplotlib.pyplot as plt
+
 
 def plot_data(
-        bufferChAmV: Array[c_int16],
-        bufferChBmV: Array[c_int16],
-        bufferChCmV: Array[c_int16],
-        bufferChDmV: Array[c_int16],
+        bufferChAmV: np.ndarray,
+        bufferChBmV: np.ndarray,
+        bufferChCmV: np.ndarray,
+        bufferChDmV: np.ndarray,
         gate: dict,
         delayBounds: tuple,
         time: np.ndarray,
@@ -28,6 +35,8 @@ def plot_data(
         timeIntervalns: float,
         title: str,
         ) -> None:
+    import matplotlib.pyplot as plt
+
     buffersMin = min(min(bufferChAmV), min(bufferChBmV), min(bufferChCmV), min(bufferChDmV))
     buffersMax = max(max(bufferChAmV), max(bufferChBmV), max(bufferChCmV), max(bufferChDmV))
     yLowerLim = buffersMin * 1.2
@@ -84,9 +93,19 @@ class Meantimer:
         self.params = params
         self.probe = probe
         self.timestamp: str = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+        # Resuming a run that did not stop cleanly: same dataset, see Checkpoint
+        self.checkpoint = Checkpoint(f'{PV_DIR}/checkpoint_mntm.json', params.get('checkpointSeconds', 10))
+        self.resume = False
+        if not self.probe and params.get('resume', 0):
+            state = self.checkpoint.load()
+            if state and not state['finished'] \
+                    and [state['filename'], state['dformat']] == [params['filename'], params['dformat']]:
+                self.timestamp = state['timestamp']
+                self.resume = True
         if not self.probe:
             self.datahandle: str = (f"{DATA_DIR}/Data/{self.params['filename']}"
                                     f"_{self.timestamp}_data.{self.params['dformat']}")
+            self.metahandle: str = f"{DATA_DIR}/Data/{self.params['filename']}_{self.timestamp}_run.json"
             if self.params['log']:  # Creating loghandle if required
                 self.loghandle: str = f"{self.params['filename']}_{self.timestamp}_mntm_log.txt"
 
@@ -100,20 +119,42 @@ class Meantimer:
         self.downsampleModeRaw = enums.PICO_RATIO_MODE['PICO_RATIO_MODE_RAW']
         self.targets = params['target']
         self.nTargets = len(params['target'])
+        self.channels = self.targets  # Channels read out on every capture
         self.analogOffset = {id: params[f'ch{id}analogOffset'] * 1000 for id in self.targets}
         self.chRange = {id: chInputRanges[params[f'ch{id}range']] * 1000000 for id in self.targets}
         self.autoTrigms = params['autoTrigms']
         self.preTrigSamples = params['preTrigSamples']
         self.postTrigSamples = params['postTrigSamples']
         self.maxSamples = params['maxSamples']
+        # Rapid-block mode: no. of triggers captured per arm, one memory segment each
+        # (segmented memory is not used while streaming, see core.streaming)
+        self.nCaptures = 1 if self.probe or params.get('streaming', 0) \
+            else max(1, params.get('nCaptures', 1))
+        # Sub-sample threshold crossing times (linear interpolation)
+        self.interpolate = bool(params.get('interpolate', 0))
 
         self.timebase = c_uint32()
         self.timeIntervalns = c_double()
         self.overvoltage = c_int16()  # Overvoltage (channel) flag
-        self.rmaxSamples = c_int32(self.maxSamples)  # Actual number of samples collected
+        self.overvoltageBulk = (c_int16 * self.nCaptures)()  # Overvoltage flags per segment
+        self.rmaxSamples = c_uint64(self.maxSamples)  # Actual number of samples collected
         self.maxADC = c_int16()  # Converted maxADC count
 
         self.count = 1  # Capture counter
+        # Capture completion: driver callback, adaptive polling as fallback
+        self.blockReady = BlockReady(
+            timeout=self.nCaptures * self.autoTrigms / 1000 + 1,
+            useCallback=bool(params.get('readyCallback', 1))
+        )
+        self.pool: BufferPool = None  # Capture buffers, created in setup()
+        self.writer: DataWriter | EventWriter | RotatingWriter = None  # Data file writer, created in setup()
+        self.archive: WaveformArchive = None  # Raw waveform archive, if enabled
+        self.ring: WaveformRing = None  # Ring buffer of the latest waveforms, if enabled
+        self.triggerOffsets = np.zeros(self.nCaptures, dtype=np.int64)  # Per segment
+        self.triggerOffsetUnits = (c_int32 * self.nCaptures)()  # Time units, per segment
+        self.armed = False  # Whether a capture is already running into the pool
+        self.metadata: RunMetadata = None  # Run metadata file, created in setup()
+        self.deadTime = DeadTime()
 
     def __check_health(self, status: hex, stop: Optional[bool] = False) -> str | None:
         if status != PICO_STATUS['PICO_OK']:
@@ -135,20 +176,44 @@ class Meantimer:
         if self.nTargets != 4:
             return err.append(f'Expected 4 trigger targets, got {self.nTargets}')
 
-        # Logging runtime parameters
+        # Logging run start, parameters are saved to the run metadata file
         if self.params['log'] and not self.probe:
-            log(self.loghandle, '==> Running acquisition with parameters:', time=True)
-            col_width = max([len(k) for k in self.params.keys()])
-            for key, value in self.params.items():
-                log(self.loghandle, f'{key: <{col_width}} {value:}')
+            log(self.loghandle, '==> Running acquisition with parameters in:', time=True)
+            log(self.loghandle, f'{self.metahandle}')
 
         if not self.probe:
             header = []
             if self.params['includeCounter']:
                 header.append('n')
             header.append('deltaT (ns)')
-            with open(self.datahandle, "a") as out:  # Creating data output file
-                out.write(format_data(header, self.params['dformat']))
+            rotation = {
+                key: self.params.get(key, 0) for key in ['rotateEvents', 'rotateMB', 'rotateMinutes']
+            }
+            if any(rotation.values()):  # Data file split in segments, see RotatingWriter
+                self.writer = RotatingWriter(
+                    self.datahandle, self.params['dformat'], header, **rotation,
+                    flushRows=self.params.get('flushRows', 1000),
+                    flushSeconds=self.params.get('flushSeconds', 1.0),
+                    resume=self.resume
+                )
+            elif self.params['dformat'] == 'npy':  # Binary records, see EventWriter
+                self.writer = EventWriter(
+                    self.datahandle,
+                    flushRows=self.params.get('flushRows', 1000),
+                    flushSeconds=self.params.get('flushSeconds', 1.0),
+                    resume=self.resume
+                )
+            else:  # Creating data output file, open until stop()
+                self.writer = DataWriter(
+                    self.datahandle, self.params['dformat'], header,
+                    flushRows=self.params.get('flushRows', 1000),
+                    flushSeconds=self.params.get('flushSeconds', 1.0),
+                    resume=self.resume
+                )
+            if self.resume:  # Counter carries on from the events already in the data file
+                self.count = self.writer.resumed + 1
+                if self.params['log']:
+                    log(self.loghandle, f'==> Resuming at event no. {self.count}', time=True)
 
         """ Opening PicoScope connection: returns handle for future use in API functions """
         self.status['openUnit'] = ps.psospaOpenUnit(
@@ -207,6 +272,10 @@ class Meantimer:
             self.chRange[id],
             self.maxADC
         ) for id in self.targets}
+        self.thresholdmV = {
+            id: (self.thresholdADC[id] * (self.chRange[id] / 1000000)) \
+            / self.maxADC.value - self.analogOffset[id] for id in self.targets
+        }
 
         """ Setting up advanced trigger on target channels.
         ps.psospaSetTriggerChannelConditions(
@@ -277,6 +346,30 @@ class Meantimer:
         )
         err.append(self.__check_health(self.status['setTriggerDelay']))
 
+        """ Capture buffers, allocated and registered with the driver only once.
+        Memory is split in two slots of `nCaptures` segments each, so the scope
+        can capture into one slot while the other is analyzed.
+        (Rapid-block mode: one segment per trigger) """
+        self.pool = BufferPool(self.channels, self.maxSamples, self.nCaptures)
+        maxSegmentSamples = c_uint64()
+        self.status['memorySegments'] = ps.psospaMemorySegments(
+            self.chandle, self.pool.nSegments, byref(maxSegmentSamples)
+        )
+        err.append(self.__check_health(self.status['memorySegments']))
+        if maxSegmentSamples.value < self.maxSamples:
+            err.append(
+                f'{self.pool.nSegments} segments allow at most '
+                f'{maxSegmentSamples.value} samples per capture'
+            )
+        if self.nCaptures > 1:
+            self.status['setNoOfCaptures'] = ps.psospaSetNoOfCaptures(
+                self.chandle, self.nCaptures
+            )
+            err.append(self.__check_health(self.status['setNoOfCaptures']))
+        for key, status in self.pool.register(self.chandle, self.downsampleModeRaw).items():
+            self.status[key] = status
+            err.append(self.__check_health(status))
+
         """ Get minimum available timebase """
         enabledChFlags = sum([       # v~~~ Filtering only A, B, C, D flags
             flag for flag, id in zip(islice(enums.PICO_CHANNEL_FLAGS.values(), 4), channelIDs) \
@@ -293,88 +386,244 @@ class Meantimer:
 
         self.timeIntervalns = c_double(self.timeIntervalns.value * 1000000000)  # to nanoseconds
 
-        return err
+        """ Raw waveform archive, written next to the data file """
+        if self.params.get('archiveWaveforms', 0) and not self.probe:
+            self.archive = WaveformArchive(
+                f"{DATA_DIR}/Data/{self.params['filename']}_{self.timestamp}_waveforms.pvw",
+                self.calibration() | {'timebase': self.timebase.value, 'timestamp': self.timestamp},
+                self.maxSamples,
+                chunkEvents=self.params.get('archiveChunkEvents', 256),
+                level=self.params.get('archiveCompression', 1),
+                resume=self.resume
+            )
 
-    def run(self) -> tuple[float | None, str | None]:
-        err = []
+        """ Ring buffer of the latest waveforms, readable while acquiring (see WaveformRing) """
+        if self.params.get('ringEvents', 0) and not self.probe:
+            self.ring = WaveformRing.create(
+                f'{PV_DIR}/ring.buf',
+                self.calibration() | {'timestamp': self.timestamp},
+                self.maxSamples,
+                self.params['ringEvents']
+            )
 
-        # Logging capture
-        if self.params['log'] and not self.probe:
-            to_be_logged = [dict(entry=f'==> Beginning capture no. {self.count}', time=True)]
+        """ Run metadata, next to the data file (totals are added in stop()) """
+        if not self.probe and all([e is None for e in err]):
+            self.metadata = RunMetadata(self.metahandle, {
+                'mode': 'mntm',
+                'params': self.params,
+                'timebase': self.timebase.value,
+                'timeIntervalns': self.timeIntervalns.value,
+                'maxADC': self.maxADC.value,
+                'device': unit_info(self.chandle),
+                'files': {
+                    'data': self.writer.path,
+                    'archive': self.archive.path if self.archive is not None else None,
+                    'log': f'{DATA_DIR}/Data/{self.loghandle}' if self.params['log'] else None,
+                },
+            }, resume=self.resume, resumedEvents=self.count - 1)
+            self.checkpoint.start({
+                'mode': 'mntm',
+                'filename': self.params['filename'],
+                'dformat': self.params['dformat'],
+                'timestamp': self.timestamp,
+                'data': self.writer.path,
+                'count': self.count,
+            })
+
+        return err
 
-        """ Run block capture """
+    def __arm(self) -> str | None:
+        """ Starts a block capture into the current pool slot """
+        self.blockReady.arm()
         self.status['runBlock'] = ps.psospaRunBlock(
             self.chandle,
             self.preTrigSamples,
             self.postTrigSamples,
             self.timebase,
-            None,                  # returned recovery time (milliseconds or NULL)
-            0,                     # segment index
-            None,                  # lpReady (using psospaIsReady instead)
-            None                   # pParameter
+            None,                      # returned recovery time (milliseconds or NULL)
+            self.pool.segment(self.pool.current),  # segment index (first one in rapid-block mode)
+            self.blockReady.callback,  # lpReady (None to poll psospaIsReady)
+            None                       # pParameter
         )
-        err.append(self.__check_health(self.status['runBlock'], stop=True))
-
-        """ Check for data collection to finish using psospaIsReady """
-        ready = c_int16(0)
-        check = c_int16(0)
-        while ready.value == check.value:
-            self.status['isReady'] = ps.psospaIsReady(self.chandle, byref(ready))
-
-        """ Create buffers ready for assigning pointers for data collection """
-        bufferAMax = (c_int16 * self.maxSamples)()
-        bufferBMax = (c_int16 * self.maxSamples)()
-        bufferCMax = (c_int16 * self.maxSamples)()
-        bufferDMax = (c_int16 * self.maxSamples)()
-
-        buffers = {
-            'A': bufferAMax, 'B': bufferBMax,
-            'C': bufferCMax, 'D': bufferDMax
-        }
+        return self.__check_health(self.status['runBlock'], stop=True)
+
+    def acquire(self) -> tuple[dict[str, np.ndarray] | None, list[str | None]]:
+        """
+        Waits for the running capture and retrieves it, then re-arms straight
+        away on the other pool slot. Returns views on the retrieved slot:
+        (nCaptures, samples) raw ADC counts per channel, or None if the
+        capture could not be retrieved (the slot still holds an older one)
+        or the wait was cancelled (see BlockReady.cancel()).
+        """
+        err = []
 
-        """ Set data buffers location for data collection """
-        for idx, name in enumerate(self.targets):
-            self.status[f'setDataBuffer{name}'] = ps.psospaSetDataBuffer(
+        """ Arm block capture, unless it was re-armed at the end of the previous run """
+        if not self.armed:
+            err.append(self.__arm())
+
+        """ Wait for data collection to finish (driver callback or back-off polling) """
+        self.status['isReady'] = self.blockReady.wait(self.chandle)
+        err.append(self.__check_health(self.status['isReady'], stop=True))
+        if not all([e is None for e in err]) or self.blockReady.cancelled:
+            return None, err
+        self.deadTime.ready()
+
+        """ Retrieve data from scope to the pool buffers registered in setup() """
+        slot = self.pool.current
+        first = self.pool.segment(slot)
+        self.rmaxSamples.value = self.maxSamples
+        if self.nCaptures == 1:
+            self.status['getValues'] = ps.psospaGetValues(
                 self.chandle,
-                channelIDs.index(name),                              # source
-                byref(buffers[name]),                                # pointer to gate buffer
-                self.maxSamples,
-                enums.PICO_DATA_TYPE['PICO_INT16_T'],
-                0,                                                   # waveform (segment index)
-                self.downsampleModeRaw,                              # downsample mode
-                self.actionClearAdd if idx == 0 else self.actionAdd  # clear busy bufs and/or add new
+                0,                        # start index
+                byref(self.rmaxSamples),  # actual no. of samples retrieved (<= maxSamples)
+                1,                        # downsample ratio
+                self.downsampleModeRaw,   # downsample mode
+                first,                    # memory segment index where data is stored
+                byref(self.overvoltage)   # overvoltage (channel) flag
             )
-            err.append(self.__check_health(self.status[f'setDataBuffer{name}'], stop=True))
+            err.append(self.__check_health(self.status['getValues'], stop=True))
+        else:
+            self.status['getValuesBulk'] = ps.psospaGetValuesBulk(
+                self.chandle,
+                0,                          # start index
+                byref(self.rmaxSamples),    # actual no. of samples retrieved (<= maxSamples)
+                first,                      # first segment index
+                first + self.nCaptures - 1, # last segment index
+                1,                          # downsample ratio
+                self.downsampleModeRaw,     # downsample mode
+                byref(self.overvoltageBulk) # overvoltage (channel) flags, one per segment
+            )
+            err.append(self.__check_health(self.status['getValuesBulk'], stop=True))
+        if not all([e is None for e in err]):
+            return None, err
+
+        """ Trigger time offsets of the captured segments, archived with the waveforms
+        (not fatal: the archive stores NaN if they are not available) """
+        triggerOffsetns = None
+        if self.archive is not None:
+            self.status['getTriggerTimeOffsets'] = ps.psospaGetValuesTriggerTimeOffsetBulk(
+                self.chandle,
+                self.triggerOffsets.ctypes.data,  # times, one per segment
+                byref(self.triggerOffsetUnits),   # time units (PICO_FS ... PICO_S), one per segment
+                first,                            # first segment index
+                first + self.nCaptures - 1        # last segment index
+            )
+            if self.status['getTriggerTimeOffsets'] == PICO_STATUS['PICO_OK']:
+                units = np.ctypeslib.as_array(self.triggerOffsetUnits)
+                triggerOffsetns = self.triggerOffsets * 10.0 ** (3 * units - 6)
 
-        """ Retrieve data from scope to buffers assigned above """
-        self.status['getValues'] = ps.psospaGetValues(
-            self.chandle,
-            0,                        # start index
-            byref(self.rmaxSamples),  # actual no. of samples retrieved (<= maxSamples)
-            1,                        # downsample ratio
-            self.downsampleModeRaw,   # downsample mode
-            0,                        # memory segment index where data is stored
-            byref(self.overvoltage)   # overvoltage (channel) flag
-        )
-        err.append(self.__check_health(self.status['getValues'], stop=True))
+        """ Re-arm straight away: the next capture fills the other slot while
+        this one is being analyzed """
+        self.armed = False
+        if not self.probe:
+            self.pool.swap()
+            err.append(self.__arm())
+            self.armed = err[-1] is None
+            self.deadTime.armed()
+
+        buffers = {id: self.pool.buffers[id][slot, :, :self.rmaxSamples.value] for id in self.channels}
+        if self.archive is not None:
+            overvoltage = np.ctypeslib.as_array(self.overvoltageBulk) if self.nCaptures > 1 \
+                else np.array([self.overvoltage.value])
+            self.archive.append(buffers, overvoltage, triggerOffsetns)
+        if self.ring is not None:
+            self.ring.append(buffers)
+
+        return buffers, err
+
+    def run(self) -> tuple[float | list[float] | None, str | None]:
+        buffers, err = self.acquire()
+        if buffers is None or not all([e is None for e in err]):  # Pool slot not refilled, see acquire()
+            return None, err
+
+        """ Probe: analyze & plot the single captured event """
+        if self.probe:
+            return self.plot({id: buffers[id][0] for id in self.channels}), err
+
+        """ Analyze all captured segments at once, then record them """
+        values = self.save(analysis.analyze(buffers, self.calibration()))
+
+        if not values:
+            return None, err
+        if self.nCaptures == 1:
+            return values[0], err
+
+        return values, err
+
+    def save(self, results: dict[str, np.ndarray]) -> list[float]:
+        """
+        Records the events of a batched analysis (see pycoviewlib.analysis),
+        skipping timed out segments. Returns the recorded values.
+        """
+        values = []
+        nEvents = len(results['timeout'])
+        if self.params['log']:
+            to_be_logged = [dict(entry=f'==> Beginning capture no. {self.count}', time=True)]
 
+        for segment in range(nEvents):
+            # Skip current segment if trigger timed out (all gates open at 0.0ns)
+            if results['timeout'][segment]:
+                if self.params['log']:
+                    to_be_logged.append(f'Skipping segment {segment} (trigger timeout).')
+                continue
 
-        """ Convert ADC counts data to mV """
-        bufferChAmV = adc2mVV2(bufferAMax, self.chRange[self.targets[0]], self.maxADC)
-        bufferChBmV = adc2mVV2(bufferBMax, self.chRange[self.targets[1]], self.maxADC)
-        bufferChCmV = adc2mVV2(bufferCMax, self.chRange[self.targets[2]], self.maxADC)
-        bufferChDmV = adc2mVV2(bufferDMax, self.chRange[self.targets[3]], self.maxADC)
+            values.append(self.record(analysis.select(results, segment)))
+        self.checkpoint.update(self.count)
 
-        """ Removing the analog offset from data points """
-        thresholdmV = {
-            id: (self.thresholdADC[id] * (self.chRange[id] / 1000000)) \
-            / self.maxADC.value - self.analogOffset[id] for id in self.targets
+        if self.params['log']:
+            if values:
+                to_be_logged.append(f'Ok! ({len(values)}/{nEvents} events)')
+            for item in to_be_logged:
+                if isinstance(item, dict):
+                    log(self.loghandle, **item)
+                else:
+                    log(self.loghandle, item)
+
+        return values
+
+    def record(self, event: dict[str, Union[float, dict, np.ndarray]]) -> float:
+        """ Appends an analyzed event to the data file, returns its delay """
+        if self.params['dformat'] == 'npy':
+            self.writer.write({'counter': self.count, 'deltaT': event['deltaT']})
+            self.count += 1
+            return event['deltaT']
+
+        data = []
+        if self.params['includeCounter']:
+            data.append(self.count)
+        data.append(event['deltaT'])
+        self.writer.write(data)
+        self.count += 1
+
+        return event['deltaT']
+
+    def calibration(self) -> dict[str, Union[int, float, str, list, dict]]:
+        """ Acquisition settings needed by pycoviewlib.analysis """
+        return {
+            'mode': 'mntm',
+            'channels': self.targets,
+            'rangeMax': self.chRange,
+            'offset': self.analogOffset,
+            'thresholdmV': {id: float(self.thresholdmV[id]) for id in self.targets},
+            'maxADC': self.maxADC.value,
+            'timeIntervalns': self.timeIntervalns.value,
+            'interpolate': self.interpolate,
+        }
+
+    def analyze(
+            self,
+            buffers: dict[str, np.ndarray]
+            ) -> dict[str, Union[float, dict, np.ndarray]] | None:
+        """
+        Computes the meantimer delay between the (A, B) and (C, D) channel
+        pairs of a single captured event. Returns None if the trigger timed out.
+        """
+        """ Convert ADC counts data to mV, removing the analog offset """
+        buffersmV = {
+            id: adc2mV_array(buffers[id], self.chRange[id], self.maxADC, self.analogOffset[id])
+            for id in self.targets
         }
-        for i in range(self.maxSamples):
-            bufferChAmV[i] -= self.analogOffset['A']
-            bufferChBmV[i] -= self.analogOffset['B']
-            bufferChCmV[i] -= self.analogOffset['C']
-            bufferChDmV[i] -= self.analogOffset['D']
 
         """ Create time data """
         time = np.linspace(
@@ -383,66 +632,71 @@ class Meantimer:
             self.rmaxSamples.value
         )
 
-        """ Detect d atapoints where the threshold was hit (both falling & rising edge) """
+        """ Detect datapoints where the threshold was hit (both falling & rising edge) """
         gate: dict[str, dict[str, float | int]] = {id: {} for id in self.targets}
-        for id, buffer in zip(self.targets, [bufferChAmV, bufferChBmV, bufferChCmV, bufferChDmV]):
+        for id in self.targets:
             gate[id] = detect_gate_open_closed(
-                buffer, time, thresholdmV[id], self.maxSamples, self.timeIntervalns.value
+                buffersmV[id], time, self.thresholdmV[id], self.maxSamples,
+                self.timeIntervalns.value, interpolate=self.interpolate
             )
-        # Skip current acquisition if trigger timed out (all gates open at 0.0ns)
         if all([g['open']['ns'] == 0.0 for g in gate.values()]):
-            if self.params['log'] and not self.probe:
-                to_be_logged.append('Skipping (trigger timeout).')
-            return None, [None]
+            return None
 
         """ Calculating relevant data """
-        data = []
-        if self.params['includeCounter']:
-            data.append(self.count)
         delayBounds = (
             gate['A']['open']['ns'] + (gate['B']['open']['ns'] - gate['A']['open']['ns']) / 2,
             gate['C']['open']['ns'] + (gate['D']['open']['ns'] - gate['C']['open']['ns']) / 2
         )
         deltaT = delayBounds[1] - delayBounds[0]
-        data.append(deltaT)
 
-        if self.params['log'] and not self.probe:
-            to_be_logged.append('Ok!')
-            for item in to_be_logged:
-                if isinstance(item, dict):
-                    log(self.loghandle, **item)
-                else:
-                    log(self.loghandle, item)
-
-        """ Print data to file & plot if requested """
-        if not self.probe:
-            with open(self.datahandle, 'a') as out:
-                out.write(format_data(data, self.params['dformat']))
-        else:
-            figure = plot_data(
-                bufferChAmV, bufferChBmV, bufferChCmV, bufferChDmV,
-                gate, delayBounds, time, deltaT, self.timeIntervalns.value,
-                f'Meantimer Probe {self.timestamp}'
-            )
-            return figure, err
+        return {
+            'deltaT': deltaT,
+            'delayBounds': delayBounds,
+            'gate': gate,
+            'time': time,
+            'buffersmV': buffersmV,
+        }
 
-        self.count += 1
+    def plot(self, buffers: dict[str, np.ndarray]) -> Optional['plt.Figure']:
+        """ Analyzes & plots a single event, None if the trigger timed out """
+        event = self.analyze(buffers)
+        if event is None:
+            return None
 
-        return deltaT, err
+        return plot_data(
+            *event['buffersmV'].values(), event['gate'], event['delayBounds'],
+            event['time'], event['deltaT'], self.timeIntervalns.value,
+            f'Meantimer Probe {self.timestamp}'
+        )
 
     def stop(self) -> str | None:
         """ Stop acquisition & close unit """
+        self.armed = False
+        if self.writer is not None:
+            self.writer.close()
+        if self.archive is not None:
+            self.archive.close()
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
         self.status['stop'] = ps.psospaStop(self.chandle)
+        self.blockReady.cancel()  # A capture being waited for (follower thread) will not come
         err = self.__check_health(self.status['stop'])
         ps.psospaCloseUnit(self.chandle)
+        if self.metadata is not None:
+            self.metadata.finish(self.count - 1, self.deadTime.summary(), err)
+            self.metadata = None
+        self.checkpoint.finish(self.count)
         if err:
             if self.params['log'] and not self.probe:
                 log(self.loghandle, f'==> Job finished with error: {err}', time=True)
+                close_log(self.loghandle)
             return err
 
         """ Logging exit status & data location """
         if self.params['log'] and not self.probe:
             log(self.loghandle, '==> Job finished without errors. Data saved to:', time=True)
-            log(self.loghandle, f'{self.datahandle}')
+            log(self.loghandle, f'{self.writer.path}')
+            close_log(self.loghandle)
 
         return None
@@ -0,0 +1,241 @@
+from picosdk.psospa import psospa as ps
+from pycoviewlib.functions import log, close_log
+from pycoviewlib import analysis
+from core.adc import ADC
+from core.tdc import TDC
+from core.meantimer import Meantimer
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from queue import Queue, Empty, Full
+from threading import Thread, Event
+from time import perf_counter
+from typing import Union
+
+
+class Pipeline:
+    """
+    Pipelined block acquisition. Runs the wrapped applet in three stages
+    connected by bounded queues:
+    - producer: only waits for, retrieves and copies out the raw capture
+      (the applet re-arms the scope right after retrieval);
+    - workers: batched analysis of the raw blocks (pycoviewlib.analysis);
+    - writer: records results to the data file, in capture order, and
+      hands the values to `run()`.
+    A full queue blocks the stage feeding it (back-pressure); how often that
+    happens and how full each queue got is logged when the run stops.
+    With the 'process' backend the analysis runs in worker processes instead
+    of threads (no GIL contention): raw captures are handed over through
+    slots of a shared memory block and only the results come back.
+    """
+    def __init__(self, applet: Union[ADC, TDC, Meantimer]):
+        self.applet = applet
+        self.params = applet.params
+        self.depth = max(1, self.params.get('pipelineDepth', 8))      # Captures in flight per queue
+        self.nWorkers = max(1, self.params.get('pipelineWorkers', 1))
+        self.backend = self.params.get('pipelineBackend', 'thread')  # 'thread' or 'process'
+
+        self.queues: dict[str, Queue] = {
+            'captures': Queue(maxsize=self.depth),  # producer -> workers
+            'results': Queue(maxsize=self.depth),   # workers -> writer
+            'output': Queue(maxsize=self.depth),    # writer -> run()
+        }
+        self.metrics = {name: {'blocked': 0, 'highWater': 0} for name in self.queues}
+        self.stopping = Event()
+        self.threads: list[Thread] = []
+        self.calibration: dict = {}
+        self.unread: list[float] = []  # Values saved while stopping that did not fit in 'output'
+
+        """ Process backend: shared memory capture slots & worker processes """
+        self.shared: SharedMemory = None
+        self.blocks: np.ndarray = None  # (slots, channels, captures, samples) view on `shared`
+        self.freeSlots = Queue()
+        self.executor: ProcessPoolExecutor = None
+
+    def setup(self) -> list[str] | None:
+        """ Configures the scope through the applet, then starts the stages """
+        err = self.applet.setup()
+        if not all([e is None for e in err]):
+            return err
+        self.calibration = self.applet.calibration()
+
+        if self.backend == 'process':
+            # Slots for every capture that can be queued, analyzed or being copied at once
+            nSlots = self.depth + self.nWorkers + 1
+            shape = (
+                nSlots, len(self.applet.channels), self.applet.nCaptures, self.applet.maxSamples
+            )
+            self.shared = SharedMemory(create=True, size=int(np.prod(shape)) * np.dtype(np.int16).itemsize)
+            self.blocks = np.ndarray(shape, dtype=np.int16, buffer=self.shared.buf)
+            _ = [self.freeSlots.put(slot) for slot in range(nSlots)]
+            # Spawned workers re-run the entry point: main.py calls freeze_support() for the PyInstaller build
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.nWorkers, mp_context=get_context('spawn')
+            )
+
+        self.threads = [Thread(target=self.__produce, name='producer', daemon=True)]
+        self.threads += [
+            Thread(target=self.__work, name=f'worker {idx}', daemon=True) for idx in range(self.nWorkers)
+        ]
+        self.threads += [Thread(target=self.__write, name='writer', daemon=True)]
+        _ = [thread.start() for thread in self.threads]
+
+        return err
+
+    def run(self) -> tuple[float | list[float] | None, list[str] | None]:
+        """
+        Values of the next recorded capture, same return as the applets' run().
+        Once stopping, also gives the values saved after 'output' was left full,
+        in one list: call until it returns None to get every value saved.
+        """
+        while True:
+            try:
+                return self.queues['output'].get(timeout=0.1)
+            except Empty:
+                if self.stopping.is_set():
+                    values, self.unread = self.unread, []
+                    return values or None, []
+
+    def __put(self, name: str, item: object, cancel: bool = False) -> bool:
+        """
+        Puts `item` on queue `name`, blocking while it is full. With `cancel`,
+        gives up as soon as the pipeline is stopping. Returns whether it was put.
+        """
+        queue = self.queues[name]
+        if queue.full():
+            self.metrics[name]['blocked'] += 1
+        while True:
+            try:
+                queue.put(item, timeout=0.1)
+            except Full:
+                if cancel and self.stopping.is_set():
+                    return False
+                continue
+            self.metrics[name]['highWater'] = max(self.metrics[name]['highWater'], queue.qsize())
+            return True
+
+    def __produce(self) -> None:
+        """ Producer stage: raw captures, numbered in acquisition order """
+        sequence = 0
+        while not self.stopping.is_set():
+            buffers, err = self.applet.acquire()
+            if not all([e is None for e in err]):
+                self.__put('output', (None, err), cancel=True)
+                break
+            if buffers is None:  # Wait cancelled by stop()
+                break
+            # Pool buffers are reused by the next captures: copy them out
+            if self.backend == 'process':
+                slot = self.freeSlots.get()
+                nSamples = buffers[self.applet.channels[0]].shape[-1]
+                for idx, id in enumerate(self.applet.channels):
+                    self.blocks[slot, idx, :, :nSamples] = buffers[id]
+                self.__put('captures', (sequence, (slot, nSamples)))
+            else:
+                self.__put('captures', (sequence, {id: buf.copy() for id, buf in buffers.items()}))
+            sequence += 1
+
+        _ = [self.__put('captures', None) for _ in range(self.nWorkers)]
+
+    def __work(self) -> None:
+        """ Worker stage: batched analysis """
+        while (item := self.queues['captures'].get()) is not None:
+            sequence, capture = item
+            try:
+                if self.backend == 'process':
+                    slot, nSamples = capture
+                    results = self.executor.submit(
+                        analysis.analyze_shared,
+                        self.shared.name, self.blocks.shape, slot, nSamples, self.calibration
+                    ).result()
+                else:
+                    results = analysis.analyze(capture, self.calibration)
+            except Exception as e:
+                results = f'Analysis failed: {e}'
+            finally:
+                if self.backend == 'process':
+                    self.freeSlots.put(capture[0])
+            self.__put('results', (sequence, results))
+
+        self.__put('results', None)
+
+    def __write(self) -> None:
+        """
+        Writer stage: records results in capture order, batching whatever
+        is already waiting in the queue.
+        """
+        pending: dict[int, Union[dict[str, np.ndarray], str]] = {}
+        nextSequence = 0
+        running = self.nWorkers
+        while running:
+            batch = [self.queues['results'].get()]
+            while len(batch) < self.depth:
+                try:
+                    batch.append(self.queues['results'].get_nowait())
+                except Empty:
+                    break
+            for item in batch:
+                if item is None:
+                    running -= 1
+                else:
+                    pending[item[0]] = item[1]
+
+            while nextSequence in pending:
+                results = pending.pop(nextSequence)
+                nextSequence += 1
+                if isinstance(results, str):
+                    self.__put('output', (None, [results]), cancel=True)
+                    continue
+                values = self.applet.save(results)
+                if not values:
+                    data = None
+                elif self.applet.nCaptures == 1:
+                    data = values[0]
+                else:
+                    data = values
+                if data is not None and not self.__put('output', (data, []), cancel=True):
+                    # Already in the data file: kept for run(), not dropped
+                    self.unread.extend(data if isinstance(data, list) else [data])
+
+    def stop(self) -> str | None:
+        """
+        Stops the scope, drains the stages, then closes the unit & files.
+        Waits at most one capture timeout in all for the stages to finish.
+        """
+        self.stopping.set()
+
+        """ Stop the scope first, so the producer is not left waiting for a capture """
+        ps.psospaStop(self.applet.chandle)
+        self.applet.blockReady.cancel()
+
+        """ The producer sends the workers' sentinels when it returns, the workers
+        the writer's ones: every stage finishes what is queued, then exits """
+        deadline = perf_counter() + self.applet.blockReady.timeout
+        _ = [thread.join(timeout=max(0.0, deadline - perf_counter())) for thread in self.threads]
+        alive = [thread.name for thread in self.threads if thread.is_alive()]
+
+        if self.params['log']:
+            for name, metric in self.metrics.items():
+                log(
+                    self.applet.loghandle,
+                    (f"Queue '{name}': full {metric['blocked']} time(s), "
+                     f"max {metric['highWater']}/{self.depth} item(s)")
+                )
+
+        """ Files are still in use by the stages left running: only the unit is closed """
+        if alive:
+            ps.psospaCloseUnit(self.applet.chandle)
+            err = f"Pipeline stage(s) did not exit: {', '.join(alive)}"
+            if self.params['log']:
+                log(self.applet.loghandle, f'==> Job finished with error: {err}', time=True)
+                close_log(self.applet.loghandle)
+            return err
+
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.blocks = None  # Views must go before the block is closed
+            self.shared.close()
+            self.shared.unlink()
+
+        return self.applet.stop()
@@ -0,0 +1,235 @@
+# Copyright (C) 2024 Pico Technology Ltd. See LICENSE file for terms.
+from picosdk.psospa import psospa as ps
+from picosdk.constants import PICO_STATUS, PICO_STATUS_LOOKUP
+from picosdk.PicoDeviceEnums import picoEnum as enums
+from picosdk.PicoDeviceStructs import PICO_STREAMING_DATA_INFO, PICO_STREAMING_DATA_TRIGGER_INFO
+from pycoviewlib.constants import channelIDs
+from pycoviewlib.functions import log
+from pycoviewlib import analysis
+from core.adc import ADC
+from core.tdc import TDC
+from core.meantimer import Meantimer
+from ctypes import c_double, byref
+import numpy as np
+from time import sleep, perf_counter
+from typing import Optional, Union
+
+
+class Streamer:
+    """
+    Continuous acquisition engine. Keeps the scope streaming with no hardware
+    trigger and looks for events in software on the incoming chunks, so no
+    dead time is spent re-arming the scope between captures.
+    The event windows (pre + post trigger samples) of every chunk are analyzed
+    together by pycoviewlib.analysis and saved by the wrapped applet's
+    `save()`, so ADC charges and TDC/Meantimer delays are computed and saved
+    exactly as in block mode.
+    """
+    def __init__(self, applet: Union[ADC, TDC, Meantimer]):
+        self.applet = applet
+        self.params = applet.params
+        self.status = {}
+
+        self.channels: list[str] = applet.channels
+        self.preTrigSamples = applet.preTrigSamples
+        self.postTrigSamples = applet.postTrigSamples
+        self.chunkSamples = self.params.get('streamChunkSamples', 100000)
+        self.pollInterval = 0.001  # Seconds between polls when no new data is available
+        self.timeout = applet.autoTrigms / 1000  # Seconds without events before giving up
+
+        self.buffers: dict[str, np.ndarray] = {}
+        self.info = (PICO_STREAMING_DATA_INFO * len(self.channels))()
+        self.triggerInfo = PICO_STREAMING_DATA_TRIGGER_INFO()
+        self.sampleInterval = c_double()
+        self.calibration: dict = {}  # Analysis settings at the streaming sample interval
+
+        """ Software trigger state, carried over between chunks """
+        self.thresholds: dict[str, int] = {}
+        self.tail = {id: np.empty(0, dtype=np.int16) for id in self.channels}
+        self.nextStart = 1  # First sample (in tail coordinates) not scanned yet
+        self.holdoff = 0    # No new trigger before this sample (end of last window)
+
+    def __check_health(self, status: hex, stop: Optional[bool] = False) -> str | None:
+        if status != PICO_STATUS['PICO_OK']:
+            err = f'{PICO_STATUS_LOOKUP[status]}'
+            if stop:
+                self.status['stop'] = ps.psospaStop(self.applet.chandle)
+                if self.status['stop'] != PICO_STATUS['PICO_OK']:
+                    err += f"+{PICO_STATUS_LOOKUP[self.status['stop']]}"
+            ps.psospaCloseUnit(self.applet.chandle)
+            if self.params['log']:
+                log(self.applet.loghandle, f"==> Job finished with error(s): {err}", time=True)
+            return err
+
+        return None
+
+    def setup(self) -> list[str] | None:
+        """ Configures the scope through the applet, then starts streaming """
+        err = self.applet.setup()
+        if not all([e is None for e in err]):
+            return err
+        chandle = self.applet.chandle
+
+        """ Software trigger thresholds (ADC counts, analog offset included).
+        ADC triggers on the gate channel only, TDC and Meantimer on the
+        coincidence of all target channels, as the hardware trigger does. """
+        if isinstance(self.applet.thresholdADC, dict):
+            self.thresholds = self.applet.thresholdADC
+        else:
+            self.thresholds = {self.channels[0]: self.applet.thresholdADC}
+
+        """ Removing hardware trigger conditions, events are found in software """
+        self.status['clearTrigger'] = ps.psospaSetTriggerChannelConditions(
+            chandle, None, 0, self.applet.actionClearAll
+        )
+        err.append(self.__check_health(self.status['clearTrigger']))
+
+        """ One streaming buffer per channel, refilled by the driver """
+        for idx, name in enumerate(self.channels):
+            self.buffers[name] = np.zeros(self.chunkSamples, dtype=np.int16)
+            self.status[f'setDataBuffer{name}'] = ps.psospaSetDataBuffer(
+                chandle,
+                channelIDs.index(name),                      # source
+                self.buffers[name].ctypes.data,              # pointer to streaming buffer
+                self.chunkSamples,
+                enums.PICO_DATA_TYPE['PICO_INT16_T'],
+                0,                                           # waveform (segment index)
+                self.applet.downsampleModeRaw,               # downsample mode
+                self.applet.actionClearAdd if idx == 0 else self.applet.actionAdd
+            )
+            err.append(self.__check_health(self.status[f'setDataBuffer{name}']))
+
+            self.info[idx].channel = channelIDs.index(name)
+            self.info[idx].mode = self.applet.downsampleModeRaw
+            self.info[idx].type = enums.PICO_DATA_TYPE['PICO_INT16_T']
+
+        """ Start streaming at the block mode sample interval (or the closest one
+        available: the driver returns the actual interval in `sampleInterval`) """
+        self.sampleInterval = c_double(self.applet.timeIntervalns.value)
+        self.status['runStreaming'] = ps.psospaRunStreaming(
+            chandle,
+            byref(self.sampleInterval),
+            enums.PICO_TIME_UNITS['PICO_NS'],
+            0,                                  # max pre-trigger samples (no trigger)
+            self.chunkSamples,                  # max post-trigger samples
+            0,                                  # autoStop (no, stream until stopped)
+            1,                                  # downsample ratio
+            self.applet.downsampleModeRaw       # downsample mode
+        )
+        err.append(self.__check_health(self.status['runStreaming']))
+
+        """ Archive, ring & run metadata were written by the applet's setup() with the
+        block mode interval, the analysis of every chunk uses the streaming one """
+        self.applet.timeIntervalns = c_double(self.sampleInterval.value)
+        for output in (self.applet.archive, self.applet.ring, self.applet.metadata):
+            if output is not None:
+                output.update({'timeIntervalns': self.sampleInterval.value})
+        self.calibration = self.applet.calibration()
+
+        if self.params['log']:
+            log(
+                self.applet.loghandle,
+                f'==> Streaming with sample interval {self.sampleInterval.value} ns',
+                time=True
+            )
+
+        return err
+
+    def run(self) -> tuple[list[float] | None, list[str] | None]:
+        """
+        Polls the driver until at least one event is found in the stream,
+        returns the values of all events found. Returns None if no event
+        shows up within the auto-trigger time.
+        """
+        err = []
+        values = []
+        started = perf_counter()
+
+        while not values:
+            if perf_counter() - started > self.timeout or self.applet.blockReady.cancelled:
+                return None, err  # No event in time, or stopping (see the applets' stop())
+
+            self.status['getStreamingLatestValues'] = ps.psospaGetStreamingLatestValues(
+                self.applet.chandle,
+                byref(self.info),
+                len(self.channels),
+                byref(self.triggerInfo)
+            )
+            status = self.status['getStreamingLatestValues']
+            if status not in (PICO_STATUS['PICO_OK'], PICO_STATUS['PICO_WAITING_FOR_DATA_BUFFERS']):
+                err.append(self.__check_health(status, stop=True))
+                return None, err
+
+            chunk = {
+                name: self.buffers[name][
+                    self.info[idx].startIndex:self.info[idx].startIndex + self.info[idx].noOfSamples
+                ]
+                for idx, name in enumerate(self.channels)
+            }
+            if self.info[0].noOfSamples > 0:
+                windows = self.__scan(chunk)
+                if windows:
+                    events = {id: np.stack([window[id] for window in windows]) for id in self.channels}
+                    if self.applet.archive is not None:
+                        self.applet.archive.append(events)
+                    if self.applet.ring is not None:
+                        self.applet.ring.append(events)
+                    results = analysis.analyze(events, self.calibration)
+                    values.extend(self.applet.save(results))
+            else:
+                sleep(self.pollInterval)
+
+            """ Buffers are full: hand them back to the driver (data was copied by __scan) """
+            if status == PICO_STATUS['PICO_WAITING_FOR_DATA_BUFFERS']:
+                for name in self.channels:
+                    self.status[f'setDataBuffer{name}'] = ps.psospaSetDataBuffer(
+                        self.applet.chandle,
+                        channelIDs.index(name),
+                        self.buffers[name].ctypes.data,
+                        self.chunkSamples,
+                        enums.PICO_DATA_TYPE['PICO_INT16_T'],
+                        0,
+                        self.applet.downsampleModeRaw,
+                        self.applet.actionAdd
+                    )
+                    err.append(self.__check_health(self.status[f'setDataBuffer{name}'], stop=True))
+
+        return values, err
+
+    def __scan(self, chunk: dict[str, np.ndarray]) -> list[dict[str, np.ndarray]]:
+        """
+        Software trigger: finds the samples where all trigger channels go below
+        their threshold and cuts a (pre + post trigger samples) window around
+        each of them. The last samples are kept to catch events across chunks.
+        """
+        data = {id: np.concatenate((self.tail[id], chunk[id])) for id in self.channels}
+        length = len(data[self.channels[0]])
+
+        below = np.logical_and.reduce([data[id] < thr for id, thr in self.thresholds.items()])
+        edges = np.flatnonzero(~below[:-1] & below[1:]) + 1
+        edges = edges[
+            (edges >= max(self.nextStart, self.preTrigSamples))
+            & (edges + self.postTrigSamples <= length)
+        ]
+
+        windows = []
+        for edge in edges:
+            if edge < self.holdoff:
+                continue
+            windows.append({
+                id: data[id][edge - self.preTrigSamples:edge + self.postTrigSamples]
+                for id in self.channels
+            })
+            self.holdoff = edge + self.postTrigSamples
+
+        """ Keep just enough samples to complete a window starting in the tail """
+        offset = max(0, length - self.preTrigSamples - self.postTrigSamples)
+        self.tail = {id: data[id][offset:].copy() for id in self.channels}
+        self.nextStart = max(self.nextStart, length - self.postTrigSamples + 1) - offset
+        self.holdoff = max(0, self.holdoff - offset)
+
+        return windows
+
+    def stop(self) -> str | None:
+        """ Stop streaming & close unit """
+        return self.applet.stop()
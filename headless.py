@@ -0,0 +1,128 @@
+"""
+Headless acquisition: runs ADC, TDC or Meantimer from a config file with no
+GUI (neither Tk nor Matplotlib is imported), e.g. over SSH on the detector
+machine. Data, log, metadata & archive files are written as by the GUI.
+
+    python headless.py --mode tdc --events 100000
+    python headless.py --preset presets/adc.ini --duration 86400
+"""
+from pycoviewlib.functions import parse_config, key_from_value
+from pycoviewlib.constants import PV_DIR, modes
+from core import adc, tdc, meantimer, streaming, pipeline
+from argparse import ArgumentParser, Namespace
+from time import perf_counter
+import signal
+import sys
+
+applets = {'adc': adc.ADC, 'tdc': tdc.TDC, 'mntm': meantimer.Meantimer}
+
+
+def load_params(args: Namespace) -> dict:
+    """ config.ini, overridden by the preset & command line, as the GUI would pass them """
+    params = parse_config(args.config)
+    if args.preset:
+        params |= parse_config(args.preset)
+    if args.mode:
+        params['mode'] = args.mode
+    if args.filename:
+        params['filename'] = args.filename
+    params['maxSamples'] = params['preTrigSamples'] + params['postTrigSamples']
+
+    return params
+
+
+def interrupt(signum: int, frame) -> None:
+    """ SIGTERM/SIGHUP (e.g. SSH session closed) stop the run cleanly, like Ctrl+C """
+    raise KeyboardInterrupt
+
+
+def run(params: dict, maxEvents: int, duration: float, report: float) -> int:
+    """ Acquires until `maxEvents` events or `duration` seconds (0 = no limit), returns exit status """
+    runner = applets[params['mode']](params)
+    if params.get('streaming', 0):  # Continuous acquisition with software trigger
+        runner = streaming.Streamer(runner)
+    elif params.get('pipeline', 0):  # Acquisition, analysis & output in separate threads
+        runner = pipeline.Pipeline(runner)
+    applet = getattr(runner, 'applet', runner)
+
+    err = runner.setup()
+    if err is None or not all([e is None for e in err]):
+        print(f"Setup failed: {', '.join(dict.fromkeys(e for e in err or [] if e is not None))}", file=sys.stderr)
+        return 1
+    print(f"Running {key_from_value(modes, params['mode'])}, data to {applet.writer.path}")
+
+    status = 0
+    events = 0
+    timeouts = 0
+    start = lastReport = perf_counter()
+    lastEvents = 0
+    try:
+        while True:
+            data, err = runner.run()
+            if not all([e is None for e in err]):
+                print(f"Error: {', '.join(dict.fromkeys(e for e in err if e is not None))}", file=sys.stderr)
+                status = 1
+                break
+            if data is None:
+                timeouts += 1
+                if timeouts >= params['maxTimeouts']:
+                    print('Too many timeouts, please check your setup.', file=sys.stderr)
+                    status = 1
+                    break
+                continue
+            timeouts = 0
+            events += len(data) if isinstance(data, list) else 1
+
+            now = perf_counter()
+            if (maxEvents and events >= maxEvents) or (duration and now - start >= duration):
+                break
+            if report and now - lastReport >= report:
+                print(
+                    f'{events} events, {events / (now - start):.1f} ev/s '
+                    f'(last {now - lastReport:.0f} s: {(events - lastEvents) / (now - lastReport):.1f} ev/s)',
+                    flush=True
+                )
+                lastReport, lastEvents = now, events
+    except KeyboardInterrupt:
+        print('Interrupted, stopping...')
+    finally:
+        elapsed = perf_counter() - start
+        err = runner.stop()
+        if err:
+            print(f'Stop failed: {err}', file=sys.stderr)
+            status = 1
+        if isinstance(runner, pipeline.Pipeline):  # Events saved while the pipeline was stopping
+            while (data := runner.run()[0]) is not None:
+                events += len(data) if isinstance(data, list) else 1
+
+    deadTime = applet.deadTime.summary()
+    print(f'{events} events in {elapsed:.1f} s ({events / elapsed if elapsed else 0.0:.1f} ev/s)')
+    if deadTime['captures']:
+        print(
+            f"{deadTime['captures']} captures, dead time {deadTime['meanSeconds'] * 1000:.3f} ms mean, "
+            f"{deadTime['maxSeconds'] * 1000:.3f} ms max ({deadTime['totalSeconds'] / elapsed:.2%} of run)"
+        )
+
+    return status
+
+
+def main() -> None:
+    parser = ArgumentParser(description='Run an acquisition without the GUI.')
+    parser.add_argument('--config', default=f'{PV_DIR}/config.ini', help='settings file (default: GUI settings)')
+    parser.add_argument('--preset', help='mode preset applied over the settings (e.g. presets/tdc.ini)')
+    parser.add_argument('--mode', choices=list(applets), help='acquisition mode (default: from settings)')
+    parser.add_argument('--filename', help='data file name prefix (default: from settings)')
+    parser.add_argument('--events', type=int, default=0, help='stop after this many events (0 = no limit)')
+    parser.add_argument('--duration', type=float, default=0, help='stop after this many seconds (0 = no limit)')
+    parser.add_argument(
+        '--report', type=float, default=10, help='seconds between rate reports (0 = summary only)'
+    )
+    args = parser.parse_args()
+
+    signal.signal(signal.SIGTERM, interrupt)
+    signal.signal(signal.SIGHUP, interrupt)
+    sys.exit(run(load_params(args), args.events, args.duration, args.report))
+
+
+if __name__ == '__main__':
+    main()
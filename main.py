@@ -3,7 +3,7 @@ Copyright (C) 2024 Pico Technology Ltd. See LICENSE for terms.
 tkSliderWidget Copyright (C) 2020, Mengxun Li
 """
 import tkinter as tk
-from tkinter.filedialog import asksaveasfilename
+from tkinter.filedialog import asksaveasfilename, askopenfilename
 from tkinter.ttk import (
     Widget, Label, Frame, Labelframe, Entry, Checkbutton, Button, Spinbox,
     OptionMenu, Notebook, Scrollbar, Separator
@@ -14,17 +14,20 @@ except ModuleNotFoundError:
     pass
 from PIL import ImageTk, Image
 from pycoviewlib.functions import parse_config, backup_config, key_from_value, get_timeinterval
+from pycoviewlib import loader
+from pycoviewlib.histogram import HistogramAccumulator, EventStore
 from pycoviewlib.constants import (
-    PV_DIR, DATA_DIR, channelIDs, dataFileTypes, modes, couplings, bandwidths, chInputRanges
+    VERSION, PV_DIR, DATA_DIR, channelIDs, dataFileTypes, modes, couplings, bandwidths, chInputRanges
 )
 import pycoviewlib.gui_resources as gui
 from pycoviewlib.tkSliderWidget.tkSliderWidget import Slider
-from core import adc, tdc, meantimer
+from core import adc, tdc, meantimer, streaming, pipeline
 from core.get_pico_info import pico_info
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from threading import Thread, Event
+from threading import Thread, Event, Lock
+from multiprocessing import freeze_support
 from queue import Queue
 from os import system
 from pathlib import Path
@@ -134,7 +137,7 @@ class App(tk.Tk):
         logo = Label(about, image=logo_img, anchor='center')
         logo.image = logo_img
         logo.pack(expand=1, fill='both', pady=gui.THIN_PAD)
-        app_version = Label(about, text='v2.0', anchor='center')
+        app_version = Label(about, text=f'v{VERSION}', anchor='center')
         app_version.pack()
         link = Label(about, text='Github Repository', foreground='blue', cursor='hand2', anchor='center')
         link.pack(pady=(0, gui.THIN_PAD))
@@ -230,20 +233,33 @@ class Histogram():
         self.hook: list[Widget] = []
         self.probe: bool = False
         self.mode: str = mode
-        self.buffer: list[float] = []
+        # Values recorded in the current run, spilled to disk past `histMemoryEvents`
+        self.buffer = EventStore(maxInMemory=params.get('histMemoryEvents', 0))
         self.job: Thread = None
         self.fig, self.ax = plt.subplots(figsize=(6, 4.3), layout='tight')
         self.bins = bins
         self.mdelay = 0 if mode == 'adc' else int(mdelay)
         self.xlim = xlim
         self.ylim = ylim if ylim else [0, 15]
+        self.counts = HistogramAccumulator(self.bins, self.xlim, self.mdelay)
+        # Bars are drawn on their own (blitting) over a saved background, see render()
+        self.bars = self.ax.stairs(
+            self.counts.counts, self.counts.edges, fill=True, color=gui.HIST_COLOR, zorder=3, animated=True
+        )
+        self.background = None
+        self.frameMs = int(1000 / max(1, params.get('histFps', 10)))  # Min. time between frames
+        self.drawn = 0  # Events in the histogram at the last frame
+        self.frame: str = None  # Next render() call scheduled with after()
         self.canvas = FigureCanvasTkAgg(self.fig, master=self.parent)
         self.canvas.get_tk_widget().grid(
             column=0, row=0, padx=gui.THIN_PAD, pady=gui.THIN_PAD, sticky='nesw'
         )
+        self.canvas.mpl_connect('draw_event', self.__on_draw)
         self.stop_event = Event()
         self.stop_event.set()
-        self.queue = Queue(maxsize=100)
+        self.stopLock = Lock()
+        self.stopped = None  # Last applet stopped, see stop_applet()
+        self.queue = Queue()  # follow() -> place_on_canvas(): (kind, item), see place_on_canvas()
 
     def create(
             self,
@@ -269,15 +285,25 @@ class Histogram():
         else:
             self.ax.set_xlim(self.xlim)
 
-        if not self.ax.patches:  # Only update ylim if histogram is empty
+        if not len(self.buffer):  # Only update ylim if histogram is empty
             self.ax.set_ylim(self.ylim)
             yticks = range(0, int(self.ax.get_ylim()[1]) + 5, 5)
             self.ax.set_yticks(ticks=list(yticks), labels=[f'{lbl}' for lbl in yticks])
 
-        if self.stop_event.is_set() and self.ax.patches:  # Readjust bins after run
-            _ = [bar.remove() for bar in self.ax.patches]
-            new_counts, new_bins = np.histogram(self.buffer, range=self.xlim, bins=self.bins)
-            self.ax.stairs(new_counts, new_bins, fill=True, color=gui.HIST_COLOR, zorder=3)
+        if bins is not None and bins != self.bins:
+            self.bins = bins
+            update_setting(['histBins'], [bins])
+
+        if mdelay is not None and mdelay != self.mdelay:
+            self.mdelay = mdelay
+            update_setting(['masterDelay'], [mdelay])
+
+        # Full rebin only if the binning changed, a new master delay moves the counts
+        if self.counts.matches(self.bins, self.xlim, self.mdelay):
+            self.counts.move(self.mdelay)
+        else:
+            self.counts.rebin(self.bins, self.xlim, self.mdelay, self.buffer.chunks())
+        self.bars.set_data(self.counts.counts, self.counts.edges)
 
         if (self.xlim[1] - self.xlim[0]) >= 200:
             xticks = range(int(self.xlim[0]), int(self.xlim[1]) + 20, 20)
@@ -289,14 +315,6 @@ class Histogram():
         self.ax.set_xticks(ticks=list(xticks), labels=[f'{lbl}' for lbl in xticks])
         self.ax.yaxis.grid(zorder=0)
 
-        if bins is not None and bins != self.bins:
-            self.bins = bins
-            update_setting(['histBins'], [bins])
-
-        if mdelay is not None and mdelay != self.mdelay:
-            self.mdelay = mdelay
-            update_setting(['masterDelay'], [mdelay])
-
         if widget_hook:
             widget_hook.state(['disabled'])
 
@@ -307,7 +325,96 @@ class Histogram():
             initialdir=f'{DATA_DIR}/Data',
             filetypes=[('PNG', '*.png'), ('PDF', '*.pdf')]
         )
+        self.bars.set_animated(False)  # Animated artists are left out of saved figures
         self.fig.savefig(figureSavePath)
+        self.bars.set_animated(True)
+        self.canvas.draw()  # Fresh background for blitting
+
+    def __on_draw(self, event) -> None:
+        """ After every full redraw: saves the background, then draws the bars over it """
+        if event.canvas is not self.canvas:  # Saving to file
+            return
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self.ax.draw_artist(self.bars)
+
+    def render(self) -> None:
+        """
+        Frame loop, run by the Tk main loop every `frameMs` during a run: takes
+        in what the follower queued and shows the events that came in since
+        the last frame, all at once. Only the bars are redrawn (blitting),
+        unless the y axis has to grow. Runs until the run is over and the
+        queue is empty.
+        """
+        self.place_on_canvas()
+        if len(self.buffer) != self.drawn:
+            self.drawn = len(self.buffer)
+            self.bars.set_data(self.counts.counts, self.counts.edges)
+            if self.__nudge_ylim() or self.background is None:
+                self.canvas.draw()
+            else:
+                self.canvas.restore_region(self.background)
+                self.ax.draw_artist(self.bars)
+                self.canvas.blit(self.ax.bbox)
+        self.frame = None
+        if not self.stop_event.is_set() or not self.queue.empty():
+            self.frame = self.root.after(self.frameMs, self.render)
+
+    def __nudge_ylim(self) -> bool:
+        """ Raises the y axis limit when the highest bar gets close to it, returns whether it did """
+        yUpperLim = int(self.ax.get_ylim()[1])
+        if self.counts.peak <= yUpperLim * 0.95:
+            return False
+        if yUpperLim < 50:
+            yLimNudge = 5
+        elif yUpperLim in range(50, 100):
+            yLimNudge = 10
+        elif yUpperLim in range(100, 200):
+            yLimNudge = 20
+        elif yUpperLim in range(200, 300):
+            yLimNudge = 25
+        elif yUpperLim in range(300, 500):
+            yLimNudge = 50
+        elif yUpperLim >= 500:
+            yLimNudge = 100
+        self.ax.set_ylim(0, yUpperLim + yLimNudge)
+        self.ax.set_yticks(
+            ticks=list(range(0, yUpperLim + 2 * yLimNudge, yLimNudge)),
+            labels=[f'{lbl}' for lbl in range(0, yUpperLim + 2 * yLimNudge, yLimNudge)]
+        )
+        if self.counts.peak > (yUpperLim + yLimNudge) * 0.95:
+            self.__nudge_ylim()  # Many events in one frame
+
+        return True
+
+    def load(self) -> None:
+        """ Fills the histogram with a previous run's data file (see pycoviewlib.loader) """
+        if not self.stop_event.is_set():
+            PV_STATUS.set('Cannot load data during a run.')
+            return
+        dataFilePath = askopenfilename(
+            initialdir=f'{DATA_DIR}/Data',
+            filetypes=[('Data files', '*.txt *.csv *.npy *.index.json')]
+        )
+        if not dataFilePath:
+            return
+        try:
+            values = loader.values(loader.load(dataFilePath), self.mode)
+        except (OSError, ValueError) as e:
+            self.root.info_window(info=[f'Could not load {Path(dataFilePath).name}: {e}'])
+            return
+        self.cleanup()
+        self.fill(values)
+        PV_STATUS.set(f'Loaded {len(self.buffer)} events from {Path(dataFilePath).name}')
+
+    def fill(self, values: np.ndarray) -> None:
+        """ Puts already recorded values in the (empty) histogram """
+        self.buffer.clear()
+        self.buffer.extend(values)
+        self.counts.rebin(self.bins, self.xlim, self.mdelay, self.buffer.chunks())
+        self.bars.set_data(self.counts.counts, self.counts.edges)
+        self.drawn = len(self.buffer)
+        self.__nudge_ylim()
+        self.canvas.draw()
 
     def start(self, max_timeouts: int, hook: list[Widget]):
         """
@@ -317,6 +424,11 @@ class Histogram():
         self.hook = hook
         PV_STATUS.set(f'Starting {key_from_value(modes, self.mode)}...')
         self.root.update_idletasks()
+        if self.frame is not None:  # Last frames of the previous run still pending
+            self.root.after_cancel(self.frame)
+            self.frame = None
+        while not self.queue.empty():
+            self.queue.get_nowait()
         self.cleanup()  # Scrape canvas & buffer if restarting
         self.follower = Thread(target=self.follow, args=[max_timeouts], daemon=True)
 
@@ -327,6 +439,10 @@ class Histogram():
                 self.applet = tdc.TDC(params)
             case 'mntm':
                 self.applet = meantimer.Meantimer(params)
+        if params.get('streaming', 0):  # Continuous acquisition with software trigger
+            self.applet = streaming.Streamer(self.applet)
+        elif params.get('pipeline', 0):  # Acquisition, analysis & output in separate threads
+            self.applet = pipeline.Pipeline(self.applet)
 
         err = self.applet.setup()
         if not all([e is None for e in err]):
@@ -334,8 +450,15 @@ class Histogram():
             PV_STATUS.set('Error!')
             self.follower = None
             return
+        applet = getattr(self.applet, 'applet', self.applet)  # Streaming/pipeline wrap the applet
+        if applet.resume:  # Resumed dataset: start from the events already recorded
+            try:
+                self.fill(loader.values(loader.load(applet.writer.path), self.mode))
+            except (OSError, ValueError) as e:
+                self.root.info_window(info=[f'Could not reload the resumed data: {e}'])
         self.stop_event.clear()
         self.follower.start()
+        self.render()
         # Turn off `Start`, `Probe` and `Log acquisition` during run
         _ = [widget.state(['disabled']) for widget in self.hook]
         self.root.protocol('WM_DELETE_WINDOW', self.kill)
@@ -343,82 +466,86 @@ class Histogram():
     def follow(self, max_timeouts: int) -> None:
         """
         Gets data by running the applet.
-        All tkinter commands must run in mainloop, so data is queued
-        to `place_on_canvas()` which is outside of follower thread.
+        All tkinter commands must run in mainloop, so values, status updates
+        & errors are only queued here, for `place_on_canvas()` (see render()).
+        Messages that end the run are queued before `stop_event` is set.
         """
-        count = 1
+        applet = self.applet  # This run's, even once another run is started
+        count = len(self.buffer) + 1  # Resumed runs carry on counting
         self.timeout = max_timeouts
 
         while not self.stop_event.is_set():
             if self.timeout == 0:
-                PV_STATUS.set('Too many timeouts, please check your setup.')
-                self.stop_event.set()
-                _ = [widget.state(['!disabled']) for widget in self.hook]
-                err = self.applet.stop()
+                self.queue.put(('status', 'Too many timeouts, please check your setup.'))
+                err = self.stop_applet(applet)
                 if err:
-                    self.root.info_window(info=[err])
-                    PV_STATUS.set('Error!')
+                    self.queue.put(('error', [err]))
+                self.queue.put(('stopped', None))
+                self.stop_event.set()
                 break
-            data, err = self.applet.run()
+            data, err = applet.run()
             if not all([e is None for e in err]):
-                self.root.info_window(info=list(dict.fromkeys(err)))
-                PV_STATUS.set('Error!')
+                self.stop_applet(applet)  # Closes the files & log (the unit is closed on errors already)
+                self.queue.put(('error', list(dict.fromkeys(e for e in err if e is not None))))
+                self.queue.put(('stopped', None))
                 self.stop_event.set()
-                _ = [widget.state(['!disabled']) for widget in self.hook]
                 continue
             elif data is None:
-                PV_STATUS.set(
+                self.queue.put((
+                    'progress',
                     (f'Capture #{count}... skipping '
                      f'(trigger timeout {max_timeouts - self.timeout + 1})')
-                )
+                ))
                 self.timeout -= 1
                 continue
             self.timeout = max_timeouts
-            self.queue.put((data, count))
-            self.place_on_canvas()
-            count += 1
+            # Rapid-block captures return one value per triggered segment
+            values = data if isinstance(data, list) else [data]
+            self.queue.put(('values', values))
+            count += len(values)
+            self.queue.put(('progress', f'Capture #{count - 1}'))
 
     def place_on_canvas(self) -> None:
-        data, count = self.queue.get()
-        self.buffer.append(data)
-
-        if count % 5 == 0:  # Only update every 5 counts
-            if self.ax.patches:
-                _ = [bar.remove() for bar in self.ax.patches]
-            counts, bins = np.histogram(
-                [value + self.mdelay for value in self.buffer], range=self.xlim, bins=self.bins
-            )
-            self.ax.stairs(counts, bins, fill=True, color=gui.HIST_COLOR, zorder=3)
-
-            yUpperLim = int(self.ax.get_ylim()[1])
-            if np.max(counts) > yUpperLim * 0.95:
-                if yUpperLim < 50:
-                    yLimNudge = 5
-                elif yUpperLim in range(50, 100):
-                    yLimNudge = 10
-                elif yUpperLim in range(100, 200):
-                    yLimNudge = 20
-                elif yUpperLim in range(200, 300):
-                    yLimNudge = 25
-                elif yUpperLim in range(300, 500):
-                    yLimNudge = 50
-                elif yUpperLim >= 500:
-                    yLimNudge = 100
-                self.ax.set_ylim(0, yUpperLim + yLimNudge)
-                self.ax.set_yticks(
-                    ticks=list(range(0, yUpperLim + 2 * yLimNudge, yLimNudge)),
-                    labels=[f'{lbl}' for lbl in range(0, yUpperLim + 2 * yLimNudge, yLimNudge)]
-                )
-            self.canvas.draw()
+        """
+        Main loop side of follow(): takes in everything queued so far, in order.
+        Values go to the histogram (shown by render()), messages to the GUI;
+        progress is only shown while running, and only the latest.
+        """
+        progress = None
+        for _ in range(self.queue.qsize()):
+            kind, item = self.queue.get_nowait()
+            match kind:
+                case 'values':
+                    for value in item:
+                        self.buffer.append(value)
+                        self.counts.add(value)
+                case 'progress':
+                    progress = item
+                case 'status':
+                    PV_STATUS.set(item)
+                case 'error':
+                    self.root.info_window(info=item)
+                    PV_STATUS.set('Error!')
+                case 'stopped':  # Run ended by the follower
+                    _ = [widget.state(['!disabled']) for widget in self.hook]
+        if progress is not None and not self.stop_event.is_set():
+            PV_STATUS.set(progress)
 
-        if not self.stop_event.is_set():
-            PV_STATUS.set(f'Capture #{count}')
-        self.queue.task_done()
+    def peek(self) -> plt.Figure | None:
+        """ Plot of the running acquisition's latest event, from its waveform ring """
+        applet = getattr(self.applet, 'applet', self.applet)  # Streaming/pipeline wrap the applet
+        if applet.ring is None or not (events := applet.ring.latest(1)):
+            return None
+        _, _, buffers = events[0]
+
+        return applet.plot(buffers)
 
     def cleanup(self) -> None:
-        if self.ax.patches:
-            _ = [bar.remove() for bar in self.ax.patches]
-            self.buffer = []
+        if len(self.buffer):
+            self.buffer.clear()
+            self.counts.clear()
+            self.drawn = 0
+            self.bars.set_data(self.counts.counts, self.counts.edges)
             self.ax.set_ylim(self.ylim)  # Reset ylim
             yticks = range(0, int(self.ax.get_ylim()[1]) + 5, 5)
             self.ax.set_yticks(ticks=list(yticks), labels=[f'{lbl}' for lbl in yticks])
@@ -431,17 +558,38 @@ class Histogram():
         PV_STATUS.set('Stopping...')
         self.root.update_idletasks()
         self.stop_event.set()
-        err = self.applet.stop()
+        if self.follower is not None and not isinstance(self.applet, pipeline.Pipeline):
+            # Follower out of run() before the files are closed (a pipeline drains its own stages)
+            applet = getattr(self.applet, 'applet', self.applet)
+            applet.blockReady.cancel()
+            self.follower.join(timeout=applet.blockReady.timeout)
+        err = self.stop_applet(self.applet)
         if err:
             self.root.info_window(info=[err])
             PV_STATUS.set('Error!')
         if self.follower is not None:
             self.follower.join(timeout=0.1)
             self.follower = None
+        if isinstance(self.applet, pipeline.Pipeline):  # Values saved while the pipeline was stopping
+            while (data := self.applet.run()[0]) is not None:
+                self.queue.put(('values', data if isinstance(data, list) else [data]))
         _ = [widget.state(['!disabled']) for widget in self.hook]
 
+    def stop_applet(
+            self,
+            applet: Union[adc.ADC, tdc.TDC, meantimer.Meantimer, streaming.Streamer, pipeline.Pipeline]
+            ) -> str | None:
+        """ Stops `applet` once, whether the follower or the main loop ends the run first """
+        with self.stopLock:
+            if applet is self.stopped:
+                return None
+            self.stopped = applet
+            return applet.stop()
+
     def kill(self) -> None:
         self.stop()
+        if self.frame is not None:
+            self.root.after_cancel(self.frame)
         self.root.quit()
         self.root.destroy()
 
@@ -455,67 +603,80 @@ def get_pico_info(root: tk.Tk) -> None:
     root.info_window(info=list(dict.fromkeys(info)), title='PicoScope Info', subtitle='PicoScope Info')
 
 
-def probe_pico(root: tk.Tk, mode: str, max_timeouts: int) -> None:
-    PV_STATUS.set('Probing PicoScope...')
-    root.update_idletasks()
+def probe_pico(
+        root: tk.Tk,
+        mode: str,
+        max_timeouts: int,
+        histogram: Optional[Histogram] = None
+        ) -> None:
+    if histogram is not None and not histogram.stop_event.is_set():
+        # Acquisition running: show its latest event instead of re-opening the scope
+        figure = histogram.peek()
+        if figure is None:
+            PV_STATUS.set('No recent waveform to show (is ringEvents enabled?)')
+            return
+    else:
+        PV_STATUS.set('Probing PicoScope...')
+        root.update_idletasks()
 
-    match mode:
-        case 'adc':
-            applet = adc.ADC(params, probe=True)
-        case 'tdc':
-            applet = tdc.TDC(params, probe=True)
-        case 'mntm':
-            applet = meantimer.Meantimer(params, probe=True)
-    err = applet.setup()
-    if not all([e is None for e in err]):
-        root.info_window(info=list(dict.fromkeys(err)))
-        PV_STATUS.set('Error!')
-        return
+        match mode:
+            case 'adc':
+                applet = adc.ADC(params, probe=True)
+            case 'tdc':
+                applet = tdc.TDC(params, probe=True)
+            case 'mntm':
+                applet = meantimer.Meantimer(params, probe=True)
+        err = applet.setup()
+        if not all([e is None for e in err]):
+            root.info_window(info=list(dict.fromkeys(err)))
+            PV_STATUS.set('Error!')
+            return
 
-    figure = None
-    timeout = max_timeouts
-    while figure is None:
-        if timeout == 0:
-            PV_STATUS.set('Too many timeouts. Please check your setup.')
-            root.update_idletasks()
-            break
-        figure, err = applet.run()
-        if figure is None:
-            PV_STATUS.set(
-                f'Probing PicoScope... (trigger timeout {max_timeouts - timeout + 1})'
-            )
-            root.update_idletasks()
-        timeout -= 1
-    if not all([e is None for e in err]):
-        root.info_window(info=list(dict.fromkeys(err)))
-        PV_STATUS.set('Error!')
-    err = applet.stop()
+        figure = None
+        timeout = max_timeouts
+        while figure is None:
+            if timeout == 0:
+                PV_STATUS.set('Too many timeouts. Please check your setup.')
+                root.update_idletasks()
+                break
+            figure, err = applet.run()
+            if figure is None:
+                PV_STATUS.set(
+                    f'Probing PicoScope... (trigger timeout {max_timeouts - timeout + 1})'
+                )
+                root.update_idletasks()
+            timeout -= 1
+        if not all([e is None for e in err]):
+            root.info_window(info=list(dict.fromkeys(err)))
+            PV_STATUS.set('Error!')
+        err = applet.stop()
 
-    if timeout != 0:
+        if timeout == 0:
+            return
         if err:
             PV_STATUS.set('Error!')
             root.info_window(info=[err])
             return
-
         PV_STATUS.set('Idle')
-        probe_window = tk.Toplevel()
-        probe_window.resizable(0, 0)
-        probe_window.title('Probe')
-        probe_window.wm_iconphoto(False, root.dock_icon)
-        probe_canvas = FigureCanvasTkAgg(figure, master=probe_window)
-        probe_canvas.get_tk_widget().grid(row=0, column=0, sticky='nesw')
-        buttons_frame = Frame(probe_window, padding=(0, gui.THIN_PAD, 0, 0))
-        buttons_frame.grid(row=1, column=0, pady=(0, gui.WIDE_PAD), sticky='nes')
-        save_as_button = Button(
-            buttons_frame, text='Save as...', width=9,
-            command=lambda: saveas(figure)
-        )
-        close_button = Button(
-            buttons_frame, text='Close', width=9,
-            command=probe_window.destroy
-        )
-        save_as_button.grid(row=1, column=0, padx=(0, gui.THIN_PAD), sticky='nse')
-        close_button.grid(row=1, column=1, padx=(0, gui.WIDE_PAD), sticky='nse')
+
+    probe_window = tk.Toplevel()
+    probe_window.resizable(0, 0)
+    probe_window.title('Probe')
+    probe_window.wm_iconphoto(False, root.dock_icon)
+    probe_canvas = FigureCanvasTkAgg(figure, master=probe_window)
+    probe_canvas.get_tk_widget().grid(row=0, column=0, sticky='nesw')
+    buttons_frame = Frame(probe_window, padding=(0, gui.THIN_PAD, 0, 0))
+    buttons_frame.grid(row=1, column=0, pady=(0, gui.WIDE_PAD), sticky='nes')
+    save_as_button = Button(
+        buttons_frame, text='Save as...', width=9,
+        command=lambda: saveas(figure)
+    )
+    close_button = Button(
+        buttons_frame, text='Close', width=9,
+        command=probe_window.destroy
+    )
+    save_as_button.grid(row=1, column=0, padx=(0, gui.THIN_PAD), sticky='nse')
+    close_button.grid(row=1, column=1, padx=(0, gui.WIDE_PAD), sticky='nse')
 
     def saveas(fig: plt.Figure) -> None:
         figureSavePath = asksaveasfilename(
@@ -862,7 +1023,7 @@ def main() -> None:
     histogram_frame.grid(column=3, row=0, rowspan=3, **gui.hist_padding, sticky='nesw')
     histogramLbf = Labelframe(histogram_frame, text='Histogram')
     histogramLbf.grid(
-        column=0, row=0, columnspan=6, sticky='nesw'
+        column=0, row=0, columnspan=7, sticky='nesw'
     )
 
     Label(histogram_frame, text='Bounds', anchor='n').grid(
@@ -947,6 +1108,12 @@ def main() -> None:
         padx=(gui.WIDE_PAD, 0), pady=(gui.WIDE_PAD, 0), ipady=gui.THIN_PAD / 2,
         sticky='nesw'
     )
+    histLoadBtn = Button(histogram_frame, text='Load...', width=8, command=histogram.load)
+    histLoadBtn.grid(
+        column=6, row=1, rowspan=2,
+        padx=(gui.WIDE_PAD, 0), pady=(gui.WIDE_PAD, 0), ipady=gui.THIN_PAD / 2,
+        sticky='nesw'
+    )
     # Enable Apply button if settings are changed
     for variable in [histBinsVar, histBounds.bars[0]['tkVar'], histBounds.bars[1]['tkVar'], masterDelayVar]:
         variable.trace_add(
@@ -957,7 +1124,8 @@ def main() -> None:
     probeButton = Button(
         summary_frame, text='PROBE',
         command=lambda: probe_pico(
-            root=root, mode=modes[modeVar.get()], max_timeouts=params['maxTimeouts']
+            root=root, mode=modes[modeVar.get()], max_timeouts=params['maxTimeouts'],
+            histogram=histogram
         )
     )
     probeButton.grid(
@@ -969,7 +1137,7 @@ def main() -> None:
         summary_frame, text='START',
         command=lambda: histogram.start(
             max_timeouts=params['maxTimeouts'],
-            hook=[startButton, logCheckBox, probeButton]
+            hook=[startButton, logCheckBox]
         )
     )
     startButton.grid(
@@ -1197,4 +1365,5 @@ def main() -> None:
 
 
 if __name__ == '__main__':
+    freeze_support()  # Pipeline worker processes in the PyInstaller build (see build.py)
     main()
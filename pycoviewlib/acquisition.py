@@ -0,0 +1,185 @@
+from picosdk.psospa import psospa as ps
+from picosdk.constants import PICO_STATUS, PICO_INFO
+from picosdk.PicoDeviceEnums import picoEnum as enums
+from pycoviewlib.constants import channelIDs
+from ctypes import c_int16, byref, create_string_buffer
+import numpy as np
+from threading import Event
+from time import sleep, perf_counter
+from typing import Optional
+
+
+def poll_ready(
+        chandle: c_int16,
+        minInterval: float = 0.0001,
+        maxInterval: float = 0.01,
+        abort: Optional[Event] = None
+        ) -> int:
+    """
+    Polls psospaIsReady until the block capture is done (or `abort` is set),
+    sleeping between polls and doubling the interval (up to `maxInterval`
+    seconds) every time. Returns the last psospaIsReady status.
+    """
+    ready = c_int16(0)
+    interval = minInterval
+    while True:
+        status = ps.psospaIsReady(chandle, byref(ready))
+        if status != PICO_STATUS['PICO_OK'] or ready.value or (abort is not None and abort.is_set()):
+            return status
+        sleep(interval)
+        interval = min(interval * 2, maxInterval)
+
+
+def unit_info(
+        chandle: c_int16,
+        lines: tuple[str, ...] = (
+            'PICO_VARIANT_INFO', 'PICO_BATCH_AND_SERIAL', 'PICO_DRIVER_VERSION', 'PICO_FIRMWARE_VERSION_1'
+        )
+        ) -> dict[str, str]:
+    """ Device information strings (psospaGetUnitInfo), lines that cannot be read are left out """
+    info = {}
+    string = create_string_buffer(64)
+    requiredSize = c_int16()
+    for line in lines:
+        status = ps.psospaGetUnitInfo(
+            chandle, string, len(string), byref(requiredSize), PICO_INFO[line]
+        )
+        if status == PICO_STATUS['PICO_OK']:
+            info[line] = string.value.decode(errors='replace')
+
+    return info
+
+
+class DeadTime:
+    """
+    Dead time bookkeeping: time from a capture being ready (retrieval starts)
+    until the scope is re-armed, during which no trigger can be recorded.
+    """
+    def __init__(self):
+        self.captures = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.readyAt: float = None
+
+    def ready(self) -> None:
+        """ Call when the capture is ready """
+        self.readyAt = perf_counter()
+        self.captures += 1
+
+    def armed(self) -> None:
+        """ Call once the scope is armed again """
+        if self.readyAt is not None:
+            dead = perf_counter() - self.readyAt
+            self.total += dead
+            self.max = max(self.max, dead)
+            self.readyAt = None
+
+    def summary(self) -> dict[str, int | float]:
+        return {
+            'captures': self.captures,
+            'totalSeconds': self.total,
+            'meanSeconds': self.total / self.captures if self.captures else 0.0,
+            'maxSeconds': self.max,
+        }
+
+
+class BlockReady:
+    """
+    Block capture completion notification. `callback` is passed to
+    psospaRunBlock as lpReady: the driver calls it from its own thread
+    when data is ready, setting `event`, so waiting costs no CPU.
+    If the callback does not fire within `timeout` seconds (or callbacks
+    are disabled) falls back to `poll_ready()`.
+    cancel() makes any wait return at once, for good: acquisition is stopping.
+    """
+    def __init__(self, timeout: float, useCallback: bool = True):
+        self.event = Event()
+        self.timeout = timeout
+        self.useCallback = useCallback
+        self.status = PICO_STATUS['PICO_OK']
+        self.cancelled = False
+        # Reference must be kept alive for as long as the driver may call it
+        self.callback = ps.BlockReadyType(self.__on_ready) if useCallback else None
+
+    def __on_ready(self, handle: int, status: int, pParameter: int) -> None:
+        self.status = status
+        self.event.set()
+
+    def arm(self) -> None:
+        """ Call right before psospaRunBlock """
+        self.status = PICO_STATUS['PICO_OK']
+        self.event.clear()
+
+    def wait(self, chandle: c_int16) -> int:
+        """ Blocks until the capture is done (or cancelled), returns the driver status """
+        if self.cancelled:
+            return self.status
+        if self.useCallback and self.event.wait(self.timeout):
+            return self.status
+
+        return poll_ready(chandle, abort=self.event)
+
+    def cancel(self) -> None:
+        """ Call from another thread, once the scope is stopped """
+        self.cancelled = True
+        self.event.set()
+
+
+class BufferPool:
+    """
+    Capture buffers allocated once as NumPy int16 arrays and registered with
+    the driver once, in setup(). Buffers are split in `nSlots` slots of
+    `nCaptures` memory segments each: the scope captures into one slot while
+    the previous one is being analyzed (double buffering).
+    buffers[id][slot, capture] is the waveform of channel `id`.
+    """
+    def __init__(self, channels: list[str], nSamples: int, nCaptures: int = 1, nSlots: int = 2):
+        self.channels = channels
+        self.nSamples = nSamples
+        self.nCaptures = nCaptures
+        self.nSlots = nSlots
+        self.nSegments = nSlots * nCaptures  # Memory segments needed on the scope
+        self.buffers: dict[str, np.ndarray] = {
+            id: np.zeros((nSlots, nCaptures, nSamples), dtype=np.int16) for id in channels
+        }
+        self.current = 0  # Slot the scope is capturing into
+
+    def segment(self, slot: int) -> int:
+        """ First memory segment of `slot` """
+        return slot * self.nCaptures
+
+    def swap(self) -> int:
+        """ Moves capture on to the next slot, returns the new slot """
+        self.current = (self.current + 1) % self.nSlots
+        return self.current
+
+    def events(self, slot: int) -> list[dict[str, np.ndarray]]:
+        """ Per-capture views on the buffers of `slot` (no copies) """
+        return [
+            {id: self.buffers[id][slot, capture] for id in self.channels}
+            for capture in range(self.nCaptures)
+        ]
+
+    def register(self, chandle: c_int16, downsampleMode: int) -> dict[str, int]:
+        """ Hands every buffer to the driver, returns the psospaSetDataBuffer statuses """
+        status = {}
+        actionClearAdd = enums.PICO_ACTION['PICO_CLEAR_ALL'] | enums.PICO_ACTION['PICO_ADD']
+        actionAdd = enums.PICO_ACTION['PICO_ADD']
+        for slot in range(self.nSlots):
+            for capture in range(self.nCaptures):
+                for idx, id in enumerate(self.channels):
+                    first = slot == 0 and capture == 0 and idx == 0
+                    status[f'setDataBuffer{id}'] = ps.psospaSetDataBuffer(
+                        chandle,
+                        channelIDs.index(id),                       # source
+                        self.buffers[id][slot, capture].ctypes.data,  # pointer to buffer
+                        self.nSamples,
+                        enums.PICO_DATA_TYPE['PICO_INT16_T'],
+                        self.segment(slot) + capture,               # waveform (segment index)
+                        downsampleMode,
+                        actionClearAdd if first else actionAdd      # clear busy bufs and/or add new
+                    )
+                    if status[f'setDataBuffer{id}'] != PICO_STATUS['PICO_OK']:
+                        return status
+
+        return status
@@ -0,0 +1,238 @@
+"""
+Batched event analysis. Every function works on (n_events, n_samples) arrays,
+one row per captured event, so a whole rapid-block capture (or a file of saved
+waveforms) is analyzed in a single vectorized call.
+The acquisition settings needed to go from raw ADC counts to physical quantities
+are passed around as a plain `calibration` dict (see the applets' `calibration()`),
+so the analysis can also run away from the scope.
+"""
+from pycoviewlib.functions import adc2mV_array, integrate_charge
+import numpy as np
+from multiprocessing.shared_memory import SharedMemory
+from typing import Union
+
+_shared: dict[str, SharedMemory] = {}  # Shared memory blocks attached by this process
+
+
+def time_axis(nSamples: int, timeIntervalns: float) -> np.ndarray[np.float64]:
+    """ Sample times (ns) of a capture, same as the applets' time data """
+    return np.linspace(0, (nSamples - 1) * timeIntervalns, nSamples)
+
+
+def detect_gates(
+        buffers: np.ndarray[np.float32],
+        threshold: float,
+        timeIntervalns: float,
+        interpolate: bool = False
+        ) -> dict[str, np.ndarray]:
+    """
+    Batched detect_gate_open_closed: for every event the gate opens at the
+    sample closest to the threshold before the waveform minimum and closes
+    at the closest one from the minimum onwards.
+    Returns the 'openIndex', 'closedIndex', 'openns' and 'closedns' arrays.
+    """
+    buffers = np.atleast_2d(buffers)
+    nEvents, nSamples = buffers.shape
+    rows = np.arange(nEvents)
+    samples = np.arange(nSamples)
+    time = time_axis(nSamples, timeIntervalns)
+
+    distance = np.abs(buffers - np.float32(threshold))
+    minIndex = np.argmin(buffers, axis=1)
+    minDistance = distance[rows, minIndex]
+
+    before = np.where(samples < minIndex[:, None], distance, np.inf)
+    openIndex = np.argmin(before, axis=1)
+    openIndex = np.where(before[rows, openIndex] < minDistance, openIndex, 0)
+
+    after = np.where(samples >= minIndex[:, None], distance, np.inf)
+    closedIndex = np.argmin(after, axis=1)
+    closedIndex = np.where(after[rows, closedIndex] < minDistance, closedIndex, openIndex)
+
+    if interpolate:
+        openns = _crossing_times(buffers, time, openIndex, threshold)
+        closedns = _crossing_times(buffers, time, closedIndex, threshold)
+    else:
+        openns, closedns = time[openIndex], time[closedIndex]
+
+    return {
+        'openIndex': openIndex,
+        'closedIndex': closedIndex,
+        'openns': openns,
+        'closedns': closedns,
+    }
+
+
+def _crossing_times(
+        buffers: np.ndarray[np.float32],
+        time: np.ndarray[np.float64],
+        hit: np.ndarray[np.int64],
+        threshold: float
+        ) -> np.ndarray[np.float64]:
+    """ Batched linear interpolation of the threshold crossings next to samples `hit` """
+    rows = np.arange(len(hit))
+    value = buffers[rows, hit].astype(np.float64)
+    crossing = time[hit]
+    done = np.zeros(len(hit), dtype=bool)
+    for step in (1, -1):
+        neighbour = np.clip(hit + step, 0, buffers.shape[1] - 1)
+        other = buffers[rows, neighbour].astype(np.float64)
+        valid = ~done & (neighbour == hit + step) & (other != value) \
+            & ((value - threshold) * (other - threshold) <= 0)
+        fraction = (threshold - value) / np.where(valid, other - value, 1.0)
+        crossing = np.where(valid, time[hit] + fraction * (time[neighbour] - time[hit]), crossing)
+        done |= valid
+
+    return crossing
+
+
+def peak_to_peak(
+        buffers: np.ndarray[np.float32],
+        openIndex: np.ndarray[np.int64],
+        closedIndex: np.ndarray[np.int64]
+        ) -> np.ndarray[np.float64]:
+    """
+    |minimum| of the whole waveform minus |maximum| within the gate,
+    NaN for events with an empty gate.
+    """
+    samples = np.arange(buffers.shape[1])
+    window = (samples >= openIndex[:, None]) & (samples < closedIndex[:, None])
+    windowMax = np.where(window, buffers, -np.inf).max(axis=1)
+    peakToPeak = np.abs(buffers.min(axis=1).astype(np.float64)) - np.abs(windowMax)
+
+    return np.where(window.any(axis=1), peakToPeak, np.nan)
+
+
+def to_mV(
+        buffers: dict[str, np.ndarray],
+        calibration: dict[str, Union[int, float, str, dict]]
+        ) -> dict[str, np.ndarray[np.float32]]:
+    """ Raw ADC counts blocks to mV (analog offset removed), per channel """
+    return {
+        id: np.atleast_2d(adc2mV_array(
+            buffers[id],
+            calibration['rangeMax'][id],
+            calibration['maxADC'],
+            calibration['offset'][id]
+        ))
+        for id in calibration['channels']
+    }
+
+
+def analyze_adc(
+        buffers: dict[str, np.ndarray],
+        calibration: dict[str, Union[int, float, str, dict]]
+        ) -> dict[str, np.ndarray]:
+    """ Charge, amplitude and peak-to-peak of every event, gated on the first channel """
+    gateID, signalID = calibration['channels']
+    buffersmV = to_mV(buffers, calibration)
+    signal = buffersmV[signalID]
+
+    gate = detect_gates(
+        buffersmV[gateID], calibration['thresholdmV'][gateID],
+        calibration['timeIntervalns'], calibration['interpolate']
+    )
+
+    return {
+        'charge': integrate_charge(
+            signal, gate['openIndex'], gate['closedIndex'],
+            calibration['timeIntervalns'], calibration['coupling'],
+            calibration.get('chargeMethod', 'rectangle'), calibration.get('baselineSamples', 0)
+        ),
+        'amplitude': np.abs(signal.min(axis=1).astype(np.float64)),
+        'peakToPeak': peak_to_peak(signal, gate['openIndex'], gate['closedIndex']),
+        'openIndex': gate['openIndex'],
+        'closedIndex': gate['closedIndex'],
+        'timeout': (gate['openns'] == 0.0) & (gate['closedns'] == 0.0),
+    }
+
+
+def analyze_tdc(
+        buffers: dict[str, np.ndarray],
+        calibration: dict[str, Union[int, float, str, dict]]
+        ) -> dict[str, np.ndarray]:
+    """ Delay between the gate opening on the second and the first channel """
+    gates = _detect_all(buffers, calibration)
+    start, stop = calibration['channels'][:2]
+
+    return {
+        'deltaT': gates[stop]['openns'] - gates[start]['openns'],
+        'openIndex': np.stack([gates[id]['openIndex'] for id in calibration['channels']], axis=1),
+        'closedIndex': np.stack([gates[id]['closedIndex'] for id in calibration['channels']], axis=1),
+        'timeout': np.logical_and.reduce([gates[id]['openns'] == 0.0 for id in gates]),
+    }
+
+
+def analyze_meantimer(
+        buffers: dict[str, np.ndarray],
+        calibration: dict[str, Union[int, float, str, dict]]
+        ) -> dict[str, np.ndarray]:
+    """ Delay between the (A, B) and (C, D) pair mid-points """
+    gates = _detect_all(buffers, calibration)
+    boundAB = gates['A']['openns'] + (gates['B']['openns'] - gates['A']['openns']) / 2
+    boundCD = gates['C']['openns'] + (gates['D']['openns'] - gates['C']['openns']) / 2
+
+    return {
+        'deltaT': boundCD - boundAB,
+        'delayBounds': np.stack([boundAB, boundCD], axis=1),
+        'openIndex': np.stack([gates[id]['openIndex'] for id in calibration['channels']], axis=1),
+        'closedIndex': np.stack([gates[id]['closedIndex'] for id in calibration['channels']], axis=1),
+        'timeout': np.logical_and.reduce([gates[id]['openns'] == 0.0 for id in gates]),
+    }
+
+
+def _detect_all(
+        buffers: dict[str, np.ndarray],
+        calibration: dict[str, Union[int, float, str, dict]]
+        ) -> dict[str, dict[str, np.ndarray]]:
+    buffersmV = to_mV(buffers, calibration)
+    return {
+        id: detect_gates(
+            buffersmV[id], calibration['thresholdmV'][id],
+            calibration['timeIntervalns'], calibration['interpolate']
+        )
+        for id in calibration['channels']
+    }
+
+
+analyzers = {'adc': analyze_adc, 'tdc': analyze_tdc, 'mntm': analyze_meantimer}
+
+
+def analyze(
+        buffers: dict[str, np.ndarray],
+        calibration: dict[str, Union[int, float, str, dict]]
+        ) -> dict[str, np.ndarray]:
+    """
+    Analyzes a block of events: `buffers` maps channel IDs to (n_events, n_samples)
+    raw ADC counts, the analysis is picked by calibration['mode'].
+    Returns one array per quantity, 'timeout' flags events where the trigger timed out.
+    """
+    return analyzers[calibration['mode']](buffers, calibration)
+
+
+def select(results: dict[str, np.ndarray], index: int) -> dict[str, Union[float, int, list]]:
+    """ Single event out of analyze() results, as plain Python values """
+    return {key: value[index].tolist() for key, value in results.items()}
+
+
+def analyze_shared(
+        name: str,
+        shape: tuple[int, int, int, int],
+        slot: int,
+        nSamples: int,
+        calibration: dict[str, Union[int, float, str, dict]]
+        ) -> dict[str, np.ndarray]:
+    """
+    analyze() on a capture stored in the shared memory block `name`, an int16
+    array of `shape` (slots, channels, captures, samples) with channels in
+    calibration['channels'] order. Runs in worker processes: the waveforms are
+    not copied and only the (small) results are sent back.
+    """
+    if name not in _shared:
+        _shared[name] = SharedMemory(name=name)
+    blocks = np.ndarray(shape, dtype=np.int16, buffer=_shared[name].buf)
+    buffers = {
+        id: blocks[slot, idx, :, :nSamples] for idx, id in enumerate(calibration['channels'])
+    }
+
+    return analyze(buffers, calibration)
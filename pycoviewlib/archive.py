@@ -0,0 +1,227 @@
+"""
+Raw waveform archive. Events are grouped in chunks, every chunk is compressed
+(zlib) and appended to the archive file, while a JSON-lines index next to it
+(`<archive>.idx`) keeps the run metadata on its first line and one line per
+chunk after that: any event is read back by decompressing its chunk only.
+A chunk holds `archiveEventDtype` metadata records followed by the int16
+waveforms of every channel, (events, samples) each, in metadata['channels'] order.
+"""
+import numpy as np
+import json
+import zlib
+from bisect import bisect_right
+from pathlib import Path
+from queue import Queue
+from threading import Thread
+from time import time as epoch
+from typing import Optional, Union
+
+# Per-event metadata stored in each chunk
+archiveEventDtype = np.dtype([
+    ('event', np.int64),           # Event number in the archive (from 0)
+    ('timestamp', np.float64),     # UNIX time (s) the event was archived
+    ('triggerOffset', np.float64), # Trigger time offset (ns), NaN if not available
+    ('overvoltage', np.int16),     # Overvoltage flags (one bit per channel)
+    ('samples', np.int32),         # Samples actually captured (waveforms are zero-padded)
+])
+
+
+class WaveformArchive:
+    """
+    Archive writer: append() copies the raw buffers into the current chunk,
+    full chunks are compressed and written by a background thread so no dead
+    time is added to the acquisition (append() only blocks if more than
+    `depth` chunks are waiting to be compressed).
+    With `resume`, an existing archive is continued after its last indexed
+    chunk (a chunk or index line torn by a crash is cut off).
+    """
+    def __init__(
+            self,
+            path: str,
+            metadata: dict[str, Union[int, float, str, list, dict]],
+            nSamples: int,
+            chunkEvents: int = 256,
+            level: int = 1,
+            depth: int = 4,
+            resume: bool = False
+            ):
+        self.path = path
+        self.channels: list[str] = metadata['channels']
+        self.nSamples = nSamples
+        self.chunkEvents = max(1, chunkEvents)
+        self.level = level
+        self.nEvents = 0   # Events appended so far
+        self.nPending = 0  # Events in the current chunk
+        self.offset = 0    # Archive file size, complete chunks only
+        self.__new_chunk()
+
+        lines = []  # Complete index lines of the archive being resumed
+        if resume and Path(path).is_file() and Path(f'{path}.idx').is_file():
+            with open(f'{path}.idx', 'r') as index:
+                lines = [line for line in index if line.endswith('\n')]
+        if lines:
+            if len(lines) > 1:
+                last = json.loads(lines[-1])
+                self.offset = last['offset'] + last['size']
+                self.nEvents = last['first'] + last['events']
+            with open(f'{path}.idx', 'w') as index:
+                index.writelines(lines)
+            self.file = open(path, 'r+b')
+            self.file.truncate(self.offset)
+            self.file.seek(self.offset)
+            self.index = open(f'{path}.idx', 'a')
+        else:
+            self.file = open(path, 'wb')
+            self.index = open(f'{path}.idx', 'w')
+            self.index.write(json.dumps(
+                metadata | {'nSamples': nSamples, 'chunkEvents': self.chunkEvents}
+            ) + '\n')
+            self.index.flush()
+
+        self.firstEvent = self.nEvents  # First event appended by this run
+        self.queue = Queue(maxsize=max(1, depth))
+        self.thread = Thread(target=self.__compress, daemon=True)
+        self.thread.start()
+
+    def update(self, metadata: dict[str, Union[int, float, str, list, dict]]) -> None:
+        """ Changes run metadata values (e.g. the actual sample interval), before any event is appended """
+        if self.nEvents != self.firstEvent:
+            raise RuntimeError('Archive metadata can only be changed before events are appended')
+        self.index.close()
+        with open(f'{self.path}.idx', 'r') as index:
+            lines = index.readlines()
+        lines[0] = json.dumps(json.loads(lines[0]) | metadata) + '\n'
+        with open(f'{self.path}.idx', 'w') as index:
+            index.writelines(lines)
+        self.index = open(f'{self.path}.idx', 'a')
+
+    def __new_chunk(self) -> None:
+        self.meta = np.zeros(self.chunkEvents, dtype=archiveEventDtype)
+        self.waveforms = {
+            id: np.zeros((self.chunkEvents, self.nSamples), dtype=np.int16) for id in self.channels
+        }
+
+    def append(
+            self,
+            buffers: dict[str, np.ndarray],
+            overvoltage: Optional[np.ndarray] = None,
+            triggerOffsetns: Optional[np.ndarray] = None
+            ) -> None:
+        """ Archives a block of events, `buffers` maps channel IDs to (events, samples) raw ADC counts """
+        n, samples = np.shape(buffers[self.channels[0]])
+        timestamp = epoch()
+        done = 0
+        while done < n:
+            size = min(n - done, self.chunkEvents - self.nPending)
+            rows = slice(self.nPending, self.nPending + size)
+            for id in self.channels:
+                self.waveforms[id][rows, :samples] = buffers[id][done:done + size]
+            meta = self.meta[rows]
+            meta['event'] = np.arange(self.nEvents, self.nEvents + size)
+            meta['timestamp'] = timestamp
+            meta['triggerOffset'] = np.nan if triggerOffsetns is None \
+                else triggerOffsetns[done:done + size]
+            meta['overvoltage'] = 0 if overvoltage is None else overvoltage[done:done + size]
+            meta['samples'] = samples
+            done += size
+            self.nEvents += size
+            self.nPending += size
+            if self.nPending == self.chunkEvents:
+                self.__submit()
+
+    def __submit(self) -> None:
+        """ Hands the current chunk over to the compression thread """
+        if self.nPending:
+            n = self.nPending
+            self.queue.put((self.meta[:n], {id: self.waveforms[id][:n] for id in self.channels}))
+            self.nPending = 0
+            self.__new_chunk()
+
+    def __compress(self) -> None:
+        offset = self.offset
+        while (item := self.queue.get()) is not None:
+            meta, waveforms = item
+            payload = meta.tobytes() + b''.join(waveforms[id].tobytes() for id in self.channels)
+            data = zlib.compress(payload, self.level)
+            self.file.write(data)
+            self.file.flush()
+            self.index.write(json.dumps({
+                'offset': offset,
+                'size': len(data),
+                'first': int(meta['event'][0]),
+                'events': len(meta),
+            }) + '\n')
+            self.index.flush()
+            offset += len(data)
+
+    def close(self) -> None:
+        """ Writes the last (partial) chunk, waits for compression & closes the files """
+        if self.file.closed:
+            return
+        self.__submit()
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()
+        self.index.close()
+
+
+def read_chunk(
+        path: str,
+        entry: dict[str, int],
+        channels: list[str],
+        nSamples: int
+        ) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+    """
+    Metadata records & (events, samples) waveforms per channel of the chunk
+    at index line `entry`: reads & decompresses that chunk only, no index needed.
+    """
+    with open(path, 'rb') as archive:
+        archive.seek(entry['offset'])
+        payload = zlib.decompress(archive.read(entry['size']))
+    n = entry['events']
+    metaSize = n * archiveEventDtype.itemsize
+    meta = np.frombuffer(payload, dtype=archiveEventDtype, count=n)
+    waveforms = np.frombuffer(payload, dtype=np.int16, offset=metaSize)
+    waveforms = waveforms.reshape(len(channels), n, nSamples)
+
+    return meta, dict(zip(channels, waveforms))
+
+
+class ArchiveReader:
+    """ Random access to a WaveformArchive: events are decompressed one chunk at a time """
+    def __init__(self, path: str):
+        self.path = path
+        with open(f'{path}.idx', 'r') as index:
+            lines = [json.loads(line) for line in index if line.strip()]
+        self.metadata: dict[str, Union[int, float, str, list, dict]] = lines[0]
+        self.chunkIndex: list[dict[str, int]] = lines[1:]
+        self.channels: list[str] = self.metadata['channels']
+        self.nSamples: int = self.metadata['nSamples']
+        self.firsts = [chunk['first'] for chunk in self.chunkIndex]
+        self.cached: tuple[int, tuple] = (-1, None)
+
+    def __len__(self) -> int:
+        return sum(chunk['events'] for chunk in self.chunkIndex)
+
+    def chunk(self, index: int) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+        """ Metadata records & (events, samples) waveforms per channel of chunk `index` """
+        if self.cached[0] == index:
+            return self.cached[1]
+        self.cached = (index, read_chunk(self.path, self.chunkIndex[index], self.channels, self.nSamples))
+
+        return self.cached[1]
+
+    def chunks(self):
+        """ Iterates over all chunks, see chunk() """
+        for index in range(len(self.chunkIndex)):
+            yield self.chunk(index)
+
+    def event(self, number: int) -> tuple[np.void, dict[str, np.ndarray]]:
+        """ Metadata record & waveform per channel of event `number` """
+        index = bisect_right(self.firsts, number) - 1
+        if index < 0 or number >= self.firsts[index] + self.chunkIndex[index]['events']:
+            raise IndexError(f'Event {number} not in archive {self.path}')
+        meta, waveforms = self.chunk(index)
+        row = number - self.firsts[index]
+
+        return meta[row], {id: waveforms[id][row] for id in self.channels}
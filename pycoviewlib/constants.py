@@ -2,6 +2,8 @@ from picosdk.PicoDeviceEnums import picoEnum as enums
 from ctypes import Structure, c_int16, c_uint16, c_int32
 from pathlib import Path
 
+VERSION = '2.0'  # PycoView release, recorded in the run metadata
+
 PV_DIR = Path('~/.local/share/pycoview/').expanduser()
 DATA_DIR = Path('~/Documents/PycoView/').expanduser()
 PYTHON = Path('~/.venv/bin/python3').expanduser()
@@ -14,7 +16,7 @@ chInputRanges = [
 maxADC = 32512
 
 channelIDs = ['A', 'B', 'C', 'D']
-dataFileTypes = ['txt', 'csv']
+dataFileTypes = ['txt', 'csv', 'npy']
 modes = {'ADC': 'adc', 'TDC': 'tdc', 'Meantimer': 'mntm'}
 timebases = {
     '200 ps': 200,
@@ -4,7 +4,10 @@ from dataclasses import dataclass
 from ctypes import c_int16, Array
 import numpy as np
 from datetime import datetime as dt
-from time import perf_counter
+from time import perf_counter, time as epoch, localtime, strftime
+from queue import SimpleQueue, Empty
+from threading import Thread, Lock
+import atexit
 from os import listdir
 from typing import Optional, Union
 from pathlib import Path
@@ -79,59 +82,146 @@ def parse_args(args: list) -> dict:
     return options
 
 
+def adc2mV_array(
+        buffer: Union[Array[c_int16], np.ndarray],
+        rangeMax: int,
+        maxADC: Union[c_int16, int],
+        offset: float = 0.0
+        ) -> np.ndarray[np.float32]:
+    """
+    Vectorized adc2mVV2: converts raw ADC counts to millivolts and removes the
+    analog offset (mV) in one step. ctypes buffers are read without copying.
+    Works on single waveforms as well as on (n_events, n_samples) blocks.
+    """
+    if not isinstance(buffer, np.ndarray):
+        buffer = np.ctypeslib.as_array(buffer)
+    maxADC = getattr(maxADC, 'value', maxADC)
+    scale = np.float32(rangeMax / 1000000 / maxADC)
+
+    return buffer * scale - np.float32(offset)
+
+
 def detect_gate_open_closed(
-        buffer: Array[c_int16],
+        buffer: np.ndarray[np.float32],
         time: np.ndarray[np.float32],
         threshold: float,
         maxSamples: int,
-        timeIntervalns: float
+        timeIntervalns: float,
+        interpolate: bool = False
         ) -> dict[str, float | int]:
     """
     minValueIndex = array index of buffer's most negative value.
-    Threshold hits are returned as (voltage, time) coordinates.
+    The gate opens at the sample closest to the threshold before it and
+    closes at the closest one from it onwards.
+    Threshold hits are returned as (voltage, time) coordinates. With
+    `interpolate`, times are linearly interpolated between the two samples
+    around the crossing (sub-sample timing).
     """
     gateChX = {
         'open': {'mV': threshold, 'ns': 0.0, 'index': 0},
         'closed': {'mV': threshold, 'ns': 0.0, 'index': 0}
         }
+    buffer = np.asarray(buffer)[:maxSamples]
+    distance = np.abs(buffer - threshold)
+    minValueIndex = int(np.argmin(buffer))
+    minDistance = distance[minValueIndex]
+
     hit = 0
-    minValue = min(buffer)
-    minValueIndex = buffer.index(minValue)
-    minDifference = minValue - threshold
-    for i in range(minValueIndex):
-        if abs(buffer[i] - threshold) < abs(minDifference):
-            hit = i
-            minDifference = buffer[i] - threshold
-    gateChX['open']['ns'] = time[hit]
+    if minValueIndex > 0:
+        before = int(np.argmin(distance[:minValueIndex]))
+        if distance[before] < minDistance:
+            hit = before
+    gateChX['open']['ns'] = _crossing_time(buffer, time, hit, threshold) if interpolate \
+        else float(time[hit])
     gateChX['open']['index'] = hit
-    minDifference = minValue - threshold
-    for i in range(minValueIndex, maxSamples):
-        if abs(buffer[i] - threshold) < abs(minDifference):
-            hit = i
-            minDifference = buffer[i] - threshold
-    gateChX['closed']['ns'] = time[hit]
+
+    after = minValueIndex + int(np.argmin(distance[minValueIndex:]))
+    if distance[after] < minDistance:
+        hit = after
+    gateChX['closed']['ns'] = _crossing_time(buffer, time, hit, threshold) if interpolate \
+        else float(time[hit])
     gateChX['closed']['index'] = hit
 
     return gateChX
 
 
+def _crossing_time(
+        buffer: np.ndarray[np.float32],
+        time: np.ndarray[np.float32],
+        hit: int,
+        threshold: float
+        ) -> float:
+    """ Linear interpolation of the threshold crossing next to sample `hit` """
+    for neighbour in (hit + 1, hit - 1):
+        if not 0 <= neighbour < len(buffer) or buffer[neighbour] == buffer[hit]:
+            continue
+        if (buffer[hit] - threshold) * (buffer[neighbour] - threshold) <= 0:
+            fraction = (threshold - buffer[hit]) / (buffer[neighbour] - buffer[hit])
+            return float(time[hit] + fraction * (time[neighbour] - time[hit]))
+
+    return float(time[hit])
+
+
+def integrate_charge(
+        buffers: np.ndarray[np.float32],
+        openIndex: Union[np.ndarray[np.int64], int],
+        closedIndex: Union[np.ndarray[np.int64], int],
+        timeIntervalns: float,
+        coupling: int,
+        method: str = 'rectangle',
+        baselineSamples: int = 0
+        ) -> np.ndarray[np.float64]:
+    """
+    Vectorized charge integral of |V| over the [open, closed) gate window of
+    one waveform or of every row of a (n_events, n_samples) block, using
+    cumulative sums. `method` is either 'rectangle' or 'trapezoid'.
+    With `baselineSamples` > 0 the mean of the first samples (pre-trigger,
+    up to the gate opening) is subtracted from each waveform first.
+    """
+    buffers = np.atleast_2d(buffers).astype(np.float64)
+    openIndex = np.atleast_1d(openIndex)
+    closedIndex = np.atleast_1d(closedIndex)
+    rows = np.arange(len(buffers))
+
+    if baselineSamples > 0:
+        end = np.minimum(baselineSamples, openIndex)
+        head = np.cumsum(buffers[:, :baselineSamples], axis=1)
+        baseline = np.where(end > 0, head[rows, np.maximum(end, 1) - 1] / np.maximum(end, 1), 0.0)
+        buffers = buffers - baseline[:, None]
+
+    magnitude = np.abs(buffers)
+    cumulative = np.zeros((len(buffers), buffers.shape[1] + 1))
+    np.cumsum(magnitude, axis=1, out=cumulative[:, 1:])
+    charge = cumulative[rows, closedIndex] - cumulative[rows, openIndex]
+    if method == 'trapezoid':
+        # Half weight on the first and last sample, no area under a single sample
+        edges = (magnitude[rows, openIndex] + magnitude[rows, np.maximum(closedIndex - 1, openIndex)]) / 2
+        charge = np.where(closedIndex - openIndex > 1, charge - edges, 0.0)
+    elif method != 'rectangle':
+        raise ValueError(f'Unknown charge integration method: {method}')
+
+    return charge * (timeIntervalns / coupling)
+
+
 def calculate_charge(
-        buffer: Array[c_int16],
+        buffer: np.ndarray[np.float32],
         gate: tuple[int],
         timeIntervalns: float,
-        coupling: int
+        coupling: int,
+        method: str = 'rectangle',
+        baselineSamples: int = 0
         ) -> float:
     """
     Total charge deposited by the particle in the detector.
     It is defined as the integral of voltage with respect to time,
     multiplied by dt and divided by the termination coupling.
+    See integrate_charge() for `method` and `baselineSamples`.
     """
-    charge = 0.0
-    for i in range(gate[0], gate[1]):
-        charge += abs(buffer[i])
-    charge *= (timeIntervalns / coupling)
+    charge = integrate_charge(
+        buffer, gate[0], gate[1], timeIntervalns, coupling, method, baselineSamples
+    )
 
-    return charge
+    return float(charge[0])
 
 
 def format_data(data: list[str | int | float], filetype: str) -> str:
@@ -140,13 +230,73 @@ def format_data(data: list[str | int | float], filetype: str) -> str:
     return dataString
 
 
+class AsyncLog:
+    """
+    Log file kept open by a background thread: write() only queues the entry,
+    the thread writes out everything queued so far and flushes.
+    """
+    def __init__(self, path: str):
+        self.queue = SimpleQueue()
+        self.file = open(path, 'a')
+        self.thread = Thread(target=self.__drain, daemon=True)
+        self.thread.start()
+
+    def write(self, entry: str) -> None:
+        self.queue.put(entry)
+
+    def __drain(self) -> None:
+        while (entry := self.queue.get()) is not None:
+            entries = [entry]
+            try:
+                while (entry := self.queue.get_nowait()) is not None:
+                    entries.append(entry)
+            except Empty:
+                pass
+            self.file.writelines(entries)
+            self.file.flush()
+            if entry is None:
+                break
+        self.file.close()
+
+    def close(self) -> None:
+        """ Returns once every queued entry is written """
+        self.queue.put(None)
+        self.thread.join()
+
+
+_logs: dict[str, AsyncLog] = {}
+_logsLock = Lock()  # Log files are opened by whichever thread logs first
+_clock: list[int | str] = [-1, '']  # Last second formatted by _timestamp()
+
+
+def _timestamp() -> str:
+    """ Current time as HH:MM:SS, formatted at most once per second """
+    now = int(epoch())
+    if now != _clock[0]:
+        _clock[:] = [now, strftime('%H:%M:%S', localtime(now))]
+    return _clock[1]
+
+
 def log(loghandle: str, entry: str, time=False) -> None:
-    """ Write to log file """
-    with open(f'{DATA_DIR}/Data/{loghandle}', 'a') as logfile:
-        if time:
-            logfile.write(f"[{dt.now().strftime('%H:%M:%S')}] {entry}\n")
-        else:
-            logfile.write(f"{' ' * 11}{entry}\n")  # 11 = len of timestamp
+    """ Write to log file (asynchronously, see AsyncLog & close_log()) """
+    with _logsLock:
+        if loghandle not in _logs:
+            _logs[loghandle] = AsyncLog(f'{DATA_DIR}/Data/{loghandle}')
+        logfile = _logs[loghandle]
+    if time:
+        logfile.write(f'[{_timestamp()}] {entry}\n')
+    else:
+        logfile.write(f"{' ' * 11}{entry}\n")  # 11 = len of timestamp
+
+
+@atexit.register
+def close_log(loghandle: Optional[str] = None) -> None:
+    """ Writes pending entries & closes the log file (all of them if no loghandle) """
+    with _logsLock:
+        handles = [loghandle] if loghandle else list(_logs)
+        logfiles = [_logs.pop(handle) for handle in handles if handle in _logs]
+    for logfile in logfiles:
+        logfile.close()
 
 
 # ------------------------- DATA CLASSES --------------------------
@@ -0,0 +1,142 @@
+import numpy as np
+from tempfile import TemporaryFile
+from threading import Lock
+from typing import Iterable, Iterator
+
+
+class EventStore:
+    """
+    Growable array of recorded values (8 or 4 bytes each instead of a boxed
+    Python float), doubling its capacity when full. With `maxInMemory`, the
+    values are spilled to a temporary file every time that many are held,
+    so memory stays bounded on multi-day runs. chunks() gives the values
+    without copying: a memory map of the spilled ones, then a view of the
+    ones still in memory.
+    """
+    def __init__(self, dtype: type = np.float64, capacity: int = 4096, maxInMemory: int = 0):
+        self.dtype = np.dtype(dtype)
+        self.maxInMemory = maxInMemory
+        self.data = np.empty(max(1, capacity), dtype=self.dtype)
+        self.n = 0         # Values in memory
+        self.nSpilled = 0  # Values in the spill file
+        self.spill = None
+
+    def __len__(self) -> int:
+        return self.nSpilled + self.n
+
+    def __reserve(self, n: int) -> None:
+        """ Makes room for `n` more values (spilling or growing) """
+        if self.maxInMemory and self.n + n > self.maxInMemory:
+            self.__spill()
+        if self.n + n > len(self.data):
+            size = max(2 * len(self.data), self.n + n)
+            if self.maxInMemory:
+                size = min(size, max(self.maxInMemory, n))
+            self.data = np.resize(self.data, size)
+
+    def append(self, value: float) -> None:
+        if self.n == len(self.data):
+            self.__reserve(1)
+        self.data[self.n] = value
+        self.n += 1
+
+    def extend(self, values: np.ndarray) -> None:
+        step = max(1, self.maxInMemory or len(values))
+        for start in range(0, len(values), step):
+            chunk = values[start:start + step]
+            self.__reserve(len(chunk))
+            self.data[self.n:self.n + len(chunk)] = chunk
+            self.n += len(chunk)
+
+    def __spill(self) -> None:
+        """ Moves the values held in memory to the spill file """
+        if self.spill is None:
+            self.spill = TemporaryFile()
+        self.spill.write(self.data[:self.n].tobytes())
+        self.spill.flush()
+        self.nSpilled += self.n
+        self.n = 0
+
+    def chunks(self) -> Iterator[np.ndarray]:
+        """ Every value, in order, in (at most two) arrays that are not copies """
+        if self.nSpilled:
+            yield np.memmap(self.spill, dtype=self.dtype, mode='r', shape=(self.nSpilled,))
+        yield self.data[:self.n]
+
+    def clear(self) -> None:
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
+        self.n = self.nSpilled = 0
+
+
+class HistogramAccumulator:
+    """
+    Fixed-bin histogram filled one value at a time: adding a value costs the
+    same however many are already in, unlike re-histogramming the whole run.
+    The bins of `bounds` are extended by as many on each side, counted too, so
+    a new master delay (`shift` of the values) only moves the edges by the
+    change in delay, the counts are kept: see move(). Only `peak` is limited
+    to the bins within `bounds`. Changing bins or bounds (or the delay by more
+    than the bounds' span) needs the values again, see rebin() & EventStore.chunks().
+    """
+    def __init__(self, bins: int, bounds: list[float], shift: float = 0.0):
+        self.lock = Lock()
+        self.rebin(bins, bounds, shift)
+
+    def rebin(
+            self,
+            bins: int,
+            bounds: list[float],
+            shift: float = 0.0,
+            values: Iterable[np.ndarray] = ()
+            ) -> None:
+        """ New binning, filled with the (unshifted) `values`, given as one or more arrays """
+        low, high = float(bounds[0]), float(bounds[1])
+        span = high - low
+        nBins = 3 * bins  # `bounds` bins and as many on each side
+        counts = np.zeros(nBins, dtype=np.int64)
+        for chunk in values:
+            counts += np.histogram(chunk + shift, range=(low - span, high + span), bins=nBins)[0]
+        with self.lock:
+            self.bins = bins
+            self.low, self.high = low, high
+            self.base = shift  # Shift the counts were filled with
+            self.scale = nBins / (3 * span)
+            self.counts = counts
+            self.baseEdges = np.linspace(low - span, high + span, nBins + 1)
+        self.move(shift)
+
+    def matches(self, bins: int, bounds: list[float], shift: float = 0.0) -> bool:
+        """ Whether the counts can be shown with the binning given, moving them if the shift changed """
+        return (bins, float(bounds[0]), float(bounds[1])) == (self.bins, self.low, self.high) \
+            and abs(shift - self.base) <= self.high - self.low
+
+    def move(self, shift: float) -> None:
+        """ New shift: every value moves by the same amount, so do the edges """
+        offset = shift - self.base
+        with self.lock:
+            self.shift = shift
+            self.edges = self.baseEdges + offset
+            # Bins showing (at least partly) within bounds
+            self.visible = (
+                max(0, int(np.floor((self.low - offset - self.baseEdges[0]) * self.scale))),
+                min(len(self.counts), int(np.ceil((self.high - offset - self.baseEdges[0]) * self.scale)))
+            )
+            self.peak = int(self.counts[slice(*self.visible)].max(initial=0))
+
+    def clear(self) -> None:
+        with self.lock:
+            self.counts = np.zeros(len(self.counts), dtype=np.int64)
+            self.peak = 0
+
+    def add(self, value: float) -> None:
+        x = value + self.base
+        if not self.baseEdges[0] <= x <= self.baseEdges[-1]:
+            return
+        # Upper bound in the last bin
+        index = min(int((x - self.baseEdges[0]) * self.scale), len(self.counts) - 1)
+        with self.lock:
+            self.counts[index] += 1
+            if self.visible[0] <= index < self.visible[1]:
+                self.peak = max(self.peak, int(self.counts[index]))
@@ -0,0 +1,98 @@
+"""
+Fast loading of the data files written by the applets (txt/csv through
+DataWriter, npy through EventWriter) as structured NumPy arrays. Text files
+are parsed in one vectorized pass and cached in a binary sidecar
+(`<file>.cache.npz`), keyed on the file's size & modification time, so
+loading the same file again is immediate. Segmented data files (see
+RotatingWriter) are loaded through their `.index.json`.
+"""
+import numpy as np
+import io
+import json
+from os import stat, replace
+from pathlib import Path
+
+# Data file header labels (see the applets' setup()) -> field names, as in eventDtype
+columnNames = {
+    'n': 'counter',
+    'amplitude (mV)': 'amplitude',
+    'peak2peak (mV)': 'peakToPeak',
+    'charge (pC)': 'charge',
+    'deltaT (ns)': 'deltaT',
+}
+
+
+def _cache_key(path: str) -> np.ndarray:
+    info = stat(path)
+    return np.array([info.st_size, info.st_mtime_ns], dtype=np.int64)
+
+
+def parse(path: str) -> np.ndarray:
+    """
+    Parses a txt (tab separated) or csv data file, header included. Only
+    complete lines are read, so files still being written can be loaded.
+    """
+    separator = ',' if Path(path).suffix == '.csv' else '\t'
+    with open(path, 'r') as file:
+        text = file.read()
+    text = text[:text.rfind('\n') + 1]
+    header, _, body = text.partition('\n')
+    labels = header.split(separator)
+    names = [columnNames.get(label, label) for label in labels]
+    dtype = np.dtype([
+        (name, np.int64 if name == 'counter' else np.float64) for name in names
+    ])
+    if not body.strip():
+        return np.zeros(0, dtype=dtype)
+    values = np.loadtxt(io.StringIO(body), delimiter=separator, ndmin=2)
+    data = np.zeros(len(values), dtype=dtype)
+    for idx, name in enumerate(names):
+        data[name] = values[:, idx]
+
+    return data
+
+
+def load(path: str, cache: bool = True) -> np.ndarray:
+    """
+    Structured array of the events in data file `path` (fields named as in
+    eventDtype, see `columnNames`). npy files are memory-mapped as they are,
+    the segments listed by an index file are joined.
+    """
+    if path.endswith('.index.json'):
+        with open(path, 'r') as file:
+            index = json.load(file)
+        segments = [
+            load(str(Path(path).parent / segment['file']), cache) for segment in index['segments']
+        ]
+        return np.concatenate(segments)
+    if Path(path).suffix == '.npy':
+        return np.load(path, mmap_mode='r')
+    if not cache:
+        return parse(path)
+
+    key = _cache_key(path)
+    sidecar = f'{path}.cache.npz'
+    try:
+        with np.load(sidecar) as cached:
+            if np.array_equal(cached['key'], key):
+                return cached['data']
+    except (OSError, KeyError, ValueError):
+        pass  # No cache yet, or unreadable: parse & (re)write it
+
+    data = parse(path)
+    temporary = f'{sidecar}.tmp'
+    with open(temporary, 'wb') as file:
+        np.savez(file, key=key, data=data)
+    replace(temporary, sidecar)
+
+    return data
+
+
+def values(data: np.ndarray, mode: str) -> np.ndarray:
+    """ The histogrammed quantity of a loaded file: charge (ADC) or deltaT (TDC, Meantimer) """
+    name = 'charge' if mode == 'adc' else 'deltaT'
+    if name not in data.dtype.names:
+        raise ValueError(f"No '{name}' column in data file")
+    column = np.asarray(data[name], dtype=np.float64)
+
+    return column[~np.isnan(column)]
@@ -0,0 +1,130 @@
+"""
+Memory-mapped ring buffer of the most recent raw waveforms. The running
+acquisition writes every event into it, so the GUI or any other process can
+look at (or dump) the last events at any time without touching the scope.
+File layout: a `headerSize` bytes header holding the JSON run metadata and,
+in its last 8 bytes, the total no. of events written; then `capacity` slots
+of `slot_dtype()`. A slot's sequence no. is -1 while it is being written.
+"""
+import numpy as np
+import json
+from time import time as epoch
+from typing import Union
+
+
+def slot_dtype(nChannels: int, nSamples: int) -> np.dtype:
+    return np.dtype([
+        ('sequence', np.int64),    # Event no. held by the slot, -1 while being written
+        ('timestamp', np.float64), # UNIX time (s) the event was written
+        ('waveforms', np.int16, (nChannels, nSamples)),
+    ])
+
+
+class WaveformRing:
+    headerSize = 4096
+
+    def __init__(self, path: str, metadata: dict[str, Union[int, float, str, list, dict]]):
+        """ Opens the ring at `path`, see create() & attach() """
+        self.path = path
+        self.metadata = metadata
+        self.channels: list[str] = metadata['channels']
+        self.nSamples: int = metadata['nSamples']
+        self.capacity: int = metadata['capacity']
+        self.dtype = slot_dtype(len(self.channels), self.nSamples)
+        self.file = np.memmap(
+            path, dtype=np.uint8, mode='r+',
+            shape=(self.headerSize + self.capacity * self.dtype.itemsize,)
+        )
+        self.written = self.file[self.headerSize - 8:self.headerSize].view(np.int64)
+        self.slots = self.file[self.headerSize:].view(self.dtype)
+
+    @classmethod
+    def create(
+            cls,
+            path: str,
+            metadata: dict[str, Union[int, float, str, list, dict]],
+            nSamples: int,
+            capacity: int
+            ) -> 'WaveformRing':
+        """ Creates (or overwrites) the ring file, for the acquisition side """
+        metadata = metadata | {'nSamples': nSamples, 'capacity': max(1, capacity)}
+        text = json.dumps(metadata).encode()
+        if len(text) > cls.headerSize - 8:
+            raise ValueError(f'Ring metadata too long ({len(text)} bytes)')
+        size = cls.headerSize + metadata['capacity'] \
+            * slot_dtype(len(metadata['channels']), nSamples).itemsize
+        with open(path, 'wb') as file:
+            file.truncate(size)
+            file.write(text)
+        ring = cls(path, metadata)
+        ring.slots['sequence'] = -1
+
+        return ring
+
+    @classmethod
+    def attach(cls, path: str) -> 'WaveformRing':
+        """ Opens an existing ring file, for readers (GUI, other processes) """
+        with open(path, 'rb') as file:
+            text = file.read(cls.headerSize - 8).rstrip(b'\x00')
+
+        return cls(path, json.loads(text))
+
+    def update(self, metadata: dict[str, Union[int, float, str, list, dict]]) -> None:
+        """ Changes run metadata values in the header (e.g. the actual sample interval) """
+        text = json.dumps(self.metadata | metadata).encode()
+        if len(text) > self.headerSize - 8:
+            raise ValueError(f'Ring metadata too long ({len(text)} bytes)')
+        self.metadata |= metadata
+        self.file[:self.headerSize - 8] = 0
+        self.file[:len(text)] = np.frombuffer(text, dtype=np.uint8)
+
+    def append(self, buffers: dict[str, np.ndarray]) -> None:
+        """ Writes a block of events: (events, samples) raw ADC counts per channel ID """
+        n, samples = np.shape(buffers[self.channels[0]])
+        timestamp = epoch()
+        for row in range(n):
+            sequence = int(self.written[0])
+            slot = self.slots[sequence % self.capacity:sequence % self.capacity + 1]
+            slot['sequence'] = -1
+            for idx, id in enumerate(self.channels):
+                slot['waveforms'][0, idx, :samples] = buffers[id][row]
+                slot['waveforms'][0, idx, samples:] = 0
+            slot['timestamp'] = timestamp
+            slot['sequence'] = sequence
+            self.written[0] = sequence + 1
+
+    def latest(self, n: int = 1) -> list[tuple[int, float, dict[str, np.ndarray]]]:
+        """
+        Copies of the last `n` events (oldest first) as (sequence no., timestamp,
+        waveform per channel). Events overwritten while being read are left out.
+        """
+        written = int(self.written[0])
+        events = []
+        for sequence in range(max(0, written - min(n, self.capacity)), written):
+            slot = self.slots[sequence % self.capacity]
+            copy = slot.copy()
+            if copy['sequence'] != sequence or slot['sequence'] != sequence:
+                continue
+            events.append((
+                sequence, float(copy['timestamp']),
+                {id: copy['waveforms'][idx] for idx, id in enumerate(self.channels)}
+            ))
+
+        return events
+
+    def dump(self, path: str, n: int) -> int:
+        """ Saves the last `n` events to a .npz file, returns how many were saved """
+        events = self.latest(n)
+        np.savez(
+            path,
+            sequence=np.array([event[0] for event in events], dtype=np.int64),
+            timestamp=np.array([event[1] for event in events]),
+            metadata=json.dumps(self.metadata),
+            **{id: np.array([event[2][id] for event in events]) for id in self.channels}
+        )
+
+        return len(events)
+
+    def close(self) -> None:
+        self.file.flush()
+        del self.written, self.slots, self.file
@@ -0,0 +1,399 @@
+from pycoviewlib.functions import format_data
+from pycoviewlib.constants import VERSION
+import numpy as np
+import json
+from datetime import datetime
+from time import perf_counter, time as epoch
+from os import fsync, replace
+from pathlib import Path
+from threading import Thread
+from typing import Optional, Union
+
+# Binary event record (EventWriter): capture counter, UNIX time (s) and results
+eventDtype = np.dtype([
+    ('counter', np.int64),
+    ('timestamp', np.float64),
+    ('charge', np.float64),
+    ('amplitude', np.float64),
+    ('peakToPeak', np.float64),
+    ('deltaT', np.float64),
+])
+
+
+def truncate_torn(path: str) -> int:
+    """
+    Cuts a text file after its last complete line (a crash can leave a line
+    half-written), returns the no. of complete lines.
+    """
+    lines, end, position = 0, 0, 0
+    with open(path, 'r+b') as file:
+        while chunk := file.read(1 << 20):
+            lines += chunk.count(b'\n')
+            if (last := chunk.rfind(b'\n')) >= 0:
+                end = position + last + 1
+            position += len(chunk)
+        file.truncate(end)
+
+    return lines
+
+
+class DataWriter:
+    """
+    Data file writer held open for the whole run. Rows are formatted and
+    buffered in memory, then written out every `flushRows` rows or every
+    `flushSeconds` seconds (checked on write), whichever comes first.
+    close() writes what is left and fsyncs the file.
+    With `resume`, an existing file is continued: a torn last row is cut
+    and `resumed` holds the no. of rows already in it.
+    """
+    def __init__(
+            self,
+            path: str,
+            filetype: str,
+            header: Optional[list[str]] = None,
+            flushRows: int = 1000,
+            flushSeconds: float = 1.0,
+            resume: bool = False
+            ):
+        self.path = path
+        self.filetype = filetype
+        self.flushRows = max(1, flushRows)
+        self.flushSeconds = flushSeconds
+        self.rows: list[str] = []
+        self.lastFlush = perf_counter()
+        self.resumed = 0
+        if resume and Path(path).is_file():
+            self.resumed = max(0, truncate_torn(path) - (1 if header else 0))
+        self.file = open(path, 'a')
+        self.size = self.file.tell()  # Bytes written, buffered rows included
+        if header and self.size == 0:
+            self.write(header)
+            self.flush()
+
+    def write(self, data: list[str | int | float]) -> None:
+        """ Buffers one row, flushing if the size or time limit was reached """
+        row = format_data(data, self.filetype)
+        self.rows.append(row)
+        self.size += len(row)
+        if len(self.rows) >= self.flushRows or perf_counter() - self.lastFlush >= self.flushSeconds:
+            self.flush()
+
+    def flush(self) -> None:
+        """ Hands the buffered rows to the OS """
+        if self.rows:
+            self.file.writelines(self.rows)
+            self.rows.clear()
+        self.file.flush()
+        self.lastFlush = perf_counter()
+
+    def close(self) -> None:
+        """ Flushes, syncs to disk & closes the file (safe to call twice) """
+        if self.file.closed:
+            return
+        self.flush()
+        fsync(self.file.fileno())
+        self.file.close()
+
+
+class EventWriter:
+    """
+    Binary event file: fixed-width records of `eventDtype` appended to a
+    .npy file that can be memory-mapped back as a structured array with
+    np.load(path, mmap_mode='r'). The file is preallocated and doubled when
+    full; the header (fixed size, rewritten in place) always holds the number
+    of records flushed so far, so the file stays readable during the run.
+    Fields that do not apply to the acquisition mode are NaN.
+    With `resume`, an existing file is continued after its last flushed
+    record (`resumed`): anything written past it was never committed.
+    """
+    headerSize = 256  # Room for the .npy header to grow without moving data
+
+    def __init__(
+            self,
+            path: str,
+            capacity: int = 65536,
+            flushRows: int = 1000,
+            flushSeconds: float = 1.0,
+            resume: bool = False
+            ):
+        self.path = path
+        self.capacity = max(1, capacity)
+        self.flushRows = max(1, flushRows)
+        self.flushSeconds = flushSeconds
+        self.count = 0  # Records flushed to the file
+        self.blank = np.zeros((), dtype=eventDtype)  # Counter 0, every other field NaN
+        for name in eventDtype.names[1:]:
+            self.blank[name] = np.nan
+        self.rows = np.zeros(self.flushRows, dtype=eventDtype)
+        self.nRows = 0  # Records buffered in `rows`
+        self.lastFlush = perf_counter()
+        self.resumed = 0
+        if resume and Path(path).is_file():
+            self.file = open(path, 'r+b')
+            np.lib.format.read_magic(self.file)
+            shape, _, dtype = np.lib.format.read_array_header_1_0(self.file)
+            if dtype != eventDtype or self.file.tell() != self.headerSize:
+                self.file.close()
+                raise ValueError(f'{path} is not an event file, cannot resume it')
+            self.count = self.resumed = shape[0]
+            self.capacity = max(self.capacity, self.count)
+        else:
+            self.file = open(path, 'w+b')
+        self.size = self.headerSize + self.count * eventDtype.itemsize  # Buffered records included
+        self.file.truncate(self.headerSize + self.capacity * eventDtype.itemsize)
+        self.__write_header()
+
+    def __write_header(self) -> None:
+        header = {
+            'descr': np.lib.format.dtype_to_descr(eventDtype),
+            'fortran_order': False,
+            'shape': (self.count,),
+        }
+        text = repr(header).encode('latin1')
+        preamble = np.lib.format.magic(1, 0) + (self.headerSize - 10).to_bytes(2, 'little')
+        self.file.seek(0)
+        self.file.write(preamble + text.ljust(self.headerSize - 11) + b'\n')
+
+    def write(self, event: dict[str, int | float]) -> None:
+        """ Buffers one record (missing fields NaN), flushing on the size or time limit """
+        row = self.rows[self.nRows:self.nRows + 1]
+        row[:] = self.blank
+        row['timestamp'] = epoch()
+        for key, value in event.items():
+            row[key] = np.nan if value is None else value
+        self.nRows += 1
+        self.size += eventDtype.itemsize
+        if self.nRows >= self.flushRows or perf_counter() - self.lastFlush >= self.flushSeconds:
+            self.flush()
+
+    def flush(self) -> None:
+        """ Writes the buffered records, growing the file if needed, then updates the header """
+        if self.nRows:
+            if self.count + self.nRows > self.capacity:
+                self.capacity = max(2 * self.capacity, self.count + self.nRows)
+                self.file.truncate(self.headerSize + self.capacity * eventDtype.itemsize)
+            self.file.seek(self.headerSize + self.count * eventDtype.itemsize)
+            self.file.write(self.rows[:self.nRows].tobytes())
+            self.count += self.nRows
+            self.nRows = 0
+            self.__write_header()
+        self.file.flush()
+        self.lastFlush = perf_counter()
+
+    def close(self) -> None:
+        """ Flushes, trims the preallocated space, syncs to disk & closes (safe to call twice) """
+        if self.file.closed:
+            return
+        self.flush()
+        self.file.truncate(self.headerSize + self.count * eventDtype.itemsize)
+        fsync(self.file.fileno())
+        self.file.close()
+
+
+class RotatingWriter:
+    """
+    Data file split in segments for long unattended runs: a new segment
+    (`<name>_0000.<ext>`, `<name>_0001.<ext>`, ... each with its own header)
+    is started every `rotateEvents` events, `rotateMB` megabytes or
+    `rotateMinutes` minutes, whichever comes first (0 = no limit).
+    `<name>.index.json` lists the segments and their event ranges (first event,
+    from 0, & no. of events; None for the segment being written) and is
+    replaced atomically at every rotation. Finished segments are closed by a
+    background thread, so rotating never holds up the acquisition.
+    With `resume`, the segments listed in an existing index are continued.
+    """
+    def __init__(
+            self,
+            path: str,
+            filetype: str,
+            header: Optional[list[str]] = None,
+            rotateEvents: int = 0,
+            rotateMB: float = 0,
+            rotateMinutes: float = 0,
+            flushRows: int = 1000,
+            flushSeconds: float = 1.0,
+            resume: bool = False
+            ):
+        base = Path(path)
+        self.stem = base.with_suffix('')
+        self.suffix = base.suffix
+        self.path = f'{self.stem}.index.json'
+        self.filetype = filetype
+        self.header = header
+        self.rotateEvents = rotateEvents
+        self.rotateBytes = rotateMB * 1000000
+        self.rotateSeconds = rotateMinutes * 60
+        self.flushRows = flushRows
+        self.flushSeconds = flushSeconds
+        self.segments: list[dict[str, Union[str, int, None]]] = []
+        self.events = 0   # Events written to every segment
+        self.closing: list[Thread] = []
+        self.segment: DataWriter | EventWriter = None
+        self.resumed = 0
+        if resume and Path(self.path).is_file():
+            with open(self.path, 'r') as file:
+                self.segments = json.load(file)['segments']
+            last = self.segments[-1]
+            if last['events'] is None:  # Segment left open: continue it
+                self.segment = self.__writer(str(self.stem.parent / last['file']), resume=True)
+                self.events = self.resumed = last['first'] + self.segment.resumed
+                self.opened = perf_counter()
+                return
+            self.events = self.resumed = last['first'] + last['events']
+        self.__open()
+
+    def __writer(self, path: str, resume: bool = False) -> DataWriter | EventWriter:
+        if self.filetype == 'npy':
+            return EventWriter(
+                path, flushRows=self.flushRows, flushSeconds=self.flushSeconds, resume=resume
+            )
+
+        return DataWriter(
+            path, self.filetype, self.header,
+            flushRows=self.flushRows, flushSeconds=self.flushSeconds, resume=resume
+        )
+
+    def __open(self) -> None:
+        path = f'{self.stem}_{len(self.segments):04d}{self.suffix}'
+        self.segment = self.__writer(path)
+        self.segments.append({
+            'file': Path(path).name,
+            'started': datetime.now().isoformat(timespec='seconds'),
+            'first': self.events,
+            'events': None,
+        })
+        self.opened = perf_counter()
+        self.__write_index()
+
+    def __write_index(self) -> None:
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump({'filetype': self.filetype, 'segments': self.segments}, file, indent=2)
+        replace(temporary, self.path)
+
+    def __finish_segment(self) -> None:
+        """ Hands the current segment to a closing thread & records its event range """
+        thread = Thread(target=self.segment.close, daemon=True)
+        thread.start()
+        self.closing = [t for t in self.closing if t.is_alive()] + [thread]
+        current = self.segments[-1]
+        current['events'] = self.events - current['first']
+
+    def write(self, data: list[str | int | float] | dict[str, int | float]) -> None:
+        """ Writes one event to the current segment (see DataWriter & EventWriter), then rotates if due """
+        self.segment.write(data)
+        self.events += 1
+        if (
+            (self.rotateEvents and self.events - self.segments[-1]['first'] >= self.rotateEvents)
+            or (self.rotateBytes and self.segment.size >= self.rotateBytes)
+            or (self.rotateSeconds and perf_counter() - self.opened >= self.rotateSeconds)
+        ):
+            self.__finish_segment()
+            self.__open()
+
+    def flush(self) -> None:
+        self.segment.flush()
+
+    def close(self) -> None:
+        """ Closes the last segment, waits for the closing ones & finalizes the index (safe to call twice) """
+        if self.segments[-1]['events'] is not None:
+            return
+        self.__finish_segment()
+        _ = [thread.join() for thread in self.closing]
+        self.__write_index()
+
+
+class RunMetadata:
+    """
+    Machine-readable record of a run (JSON), next to the data file: settings
+    written once at setup, totals & dead time statistics added by finish().
+    The file is replaced atomically, so it is always complete.
+    When a run is resumed the existing record is kept and the resume time
+    added to it; `resumedEvents` are the events recorded before resuming.
+    """
+    def __init__(self, path: str, fields: dict, resume: bool = False, resumedEvents: int = 0):
+        self.path = path
+        self.start = perf_counter()
+        self.resumedEvents = resumedEvents
+        now = datetime.now().isoformat(timespec='seconds')
+        if resume and Path(path).is_file():
+            with open(path, 'r') as file:
+                previous = json.load(file)
+            self.fields = previous | fields | {'resumed': previous.get('resumed', []) + [now]}
+        else:
+            self.fields = {'version': VERSION, 'started': now} | fields
+        self.write()
+
+    def update(self, fields: dict) -> None:
+        self.fields |= fields
+        self.write()
+
+    def finish(self, events: int, deadTime: dict[str, int | float], error: Optional[str] = None) -> None:
+        """
+        Adds run totals: events recorded, event rate & dead time (see DeadTime),
+        the last two over the time since setup (or since resuming).
+        """
+        duration = perf_counter() - self.start
+        self.update({
+            'stopped': datetime.now().isoformat(timespec='seconds'),
+            'durationSeconds': duration,
+            'events': events,
+            'eventRate': (events - self.resumedEvents) / duration if duration > 0 else 0.0,
+            'deadTime': deadTime | {
+                'fraction': deadTime['totalSeconds'] / duration if duration > 0 else 0.0
+            },
+            'error': error,
+        })
+
+    def write(self) -> None:
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(self.fields, file, indent=2, default=str)
+        replace(temporary, self.path)
+
+
+class Checkpoint:
+    """
+    Resume point of the running acquisition (JSON, replaced atomically): the
+    dataset being written & its event counter, saved at most every `interval`
+    seconds. A run that did not stop cleanly stays 'finished': false, so the
+    next run of the same mode can continue its dataset (see `resume`).
+    """
+    def __init__(self, path: str, interval: float = 10.0):
+        self.path = path
+        self.interval = interval
+        self.state: dict[str, Union[int, str, bool]] = None
+        self.lastSave = perf_counter()
+
+    def load(self) -> dict[str, Union[int, str, bool]] | None:
+        """ Last saved state, None if there is none (or it is unreadable) """
+        try:
+            with open(self.path, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def start(self, state: dict[str, Union[int, str, bool]]) -> None:
+        self.state = state | {'finished': False}
+        self.save()
+
+    def update(self, count: int) -> None:
+        """ Records the event counter, saving if `interval` has passed """
+        if self.state is not None:
+            self.state['count'] = count
+            if perf_counter() - self.lastSave >= self.interval:
+                self.save()
+
+    def finish(self, count: int) -> None:
+        """ Marks the run as cleanly stopped """
+        if self.state is not None:
+            self.state |= {'count': count, 'finished': True}
+            self.save()
+            self.state = None
+
+    def save(self) -> None:
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(self.state, file)
+        replace(temporary, self.path)
+        self.lastSave = perf_counter()
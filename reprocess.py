@@ -0,0 +1,127 @@
+"""
+Offline reprocessing of raw waveform archives (see pycoviewlib.archive).
+Re-runs the ADC/TDC/Meantimer analysis on archived events with new settings
+and writes a new results file, analyzing archive chunks in parallel.
+
+    python reprocess.py RUN_waveforms.pvw [...] -o results.csv --threshold -40
+"""
+from pycoviewlib.archive import ArchiveReader, read_chunk
+from pycoviewlib import analysis
+from pycoviewlib.writers import DataWriter, EventWriter
+from concurrent.futures import ProcessPoolExecutor
+from argparse import ArgumentParser, Namespace
+from pathlib import Path
+from os import cpu_count
+import numpy as np
+from typing import Union
+
+
+def override(
+        calibration: dict[str, Union[int, float, str, list, dict]],
+        args: Namespace
+        ) -> dict[str, Union[int, float, str, list, dict]]:
+    """ Archived calibration with the settings given on the command line """
+    calibration = dict(calibration)
+    if args.threshold is not None:
+        calibration['thresholdmV'] = {id: args.threshold for id in calibration['thresholdmV']}
+    if args.interpolate is not None:
+        calibration['interpolate'] = args.interpolate
+    if args.charge_method is not None:
+        calibration['chargeMethod'] = args.charge_method
+    if args.baseline is not None:
+        calibration['baselineSamples'] = args.baseline
+
+    return calibration
+
+
+def process_chunk(
+        path: str,
+        entry: dict[str, int],
+        channels: list[str],
+        nSamples: int,
+        calibration: dict[str, Union[int, float, str, list, dict]]
+        ) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+    """ Worker: archived metadata & analysis results of the chunk at index line `entry` """
+    meta, waveforms = read_chunk(path, entry, channels, nSamples)
+
+    return meta, analysis.analyze(waveforms, calibration)
+
+
+def reprocess(args: Namespace) -> int:
+    """ Returns the no. of events written """
+    readers = [ArchiveReader(path) for path in args.archives]
+    modes = {reader.metadata['mode'] for reader in readers}
+    if len(modes) != 1:
+        raise SystemExit(f'Archives from different modes cannot be merged: {sorted(modes)}')
+    mode = modes.pop()
+
+    # Index lines are read once here, workers only seek & decompress their chunk
+    jobs = [
+        (reader.path, entry, reader.channels, reader.nSamples, override(reader.metadata, args))
+        for reader in readers for entry in reader.chunkIndex
+    ]
+
+    filetype = Path(args.output).suffix.lstrip('.')
+    if filetype == 'npy':
+        writer = EventWriter(args.output)
+    else:
+        header = ['n', 'amplitude (mV)', 'peak2peak (mV)', 'charge (pC)'] if mode == 'adc' \
+            else ['n', 'deltaT (ns)']
+        writer = DataWriter(args.output, 'txt' if filetype == 'txt' else 'csv', header)
+
+    # deltaT is written raw, as by the applets: the master delay is added when histogrammed
+    count = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for meta, results in executor.map(process_chunk, *zip(*jobs)):
+            for row in np.flatnonzero(~results['timeout']):
+                count += 1
+                event = analysis.select(results, row)
+                if filetype == 'npy':
+                    fields = {
+                        'counter': count,
+                        'timestamp': float(meta['timestamp'][row]),
+                    }
+                    if mode == 'adc':
+                        fields |= {key: event[key] for key in ('charge', 'amplitude', 'peakToPeak')}
+                    else:
+                        fields['deltaT'] = event['deltaT']
+                    writer.write(fields)
+                elif mode == 'adc':
+                    writer.write([count, event['amplitude'], event['peakToPeak'], event['charge']])
+                else:
+                    writer.write([count, event['deltaT']])
+    writer.close()
+
+    return count
+
+
+def main() -> None:
+    parser = ArgumentParser(description='Re-analyze raw waveform archives with new settings.')
+    parser.add_argument('archives', nargs='+', help='waveform archive(s) (.pvw), in time order')
+    parser.add_argument('-o', '--output', required=True, help='results file (.txt, .csv or .npy)')
+    parser.add_argument('--threshold', type=float, help='gate threshold (mV) for every channel')
+    parser.add_argument(
+        '--interpolate', action='store_true', default=None,
+        help='sub-sample threshold crossing times'
+    )
+    parser.add_argument(
+        '--no-interpolate', action='store_false', dest='interpolate',
+        help='threshold crossing times on samples'
+    )
+    parser.add_argument(
+        '--charge-method', choices=['rectangle', 'trapezoid'], help='charge integration rule (ADC)'
+    )
+    parser.add_argument(
+        '--baseline', type=int, help='pre-trigger samples for baseline subtraction (ADC, 0 = off)'
+    )
+    parser.add_argument(
+        '--workers', type=int, default=cpu_count(), help='worker processes (default: all cores)'
+    )
+    args = parser.parse_args()
+
+    count = reprocess(args)
+    print(f'{count} events written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()